@@ -0,0 +1,143 @@
+import io, os, hashlib
+from PIL import Image
+
+
+def describeAsset(path, stat):
+    # (mtime, size, width, height, hash) of the file at path. Only the png
+    # header is parsed for the dimensions, the pixels are never decoded.
+    with open(path, "rb") as fil:
+        data = fil.read()
+    width, height = Image.open(io.BytesIO(data)).size
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+    return stat.st_mtime_ns, stat.st_size, width, height, digest
+
+
+class assetIndex:
+    # Dimensions and content hashes of the assets below the root of a
+    # cacheFile, persisted next to the thumbnails. update() stat-diffs a scan
+    # against the stored entries so only new or modified files are read.
+    # Lookups are served from memory.
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS assets (
+            path TEXT PRIMARY KEY,
+            basename TEXT NOT NULL,
+            mtime INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            width INTEGER NOT NULL,
+            height INTEGER NOT NULL,
+            hash TEXT NOT NULL
+        )
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        # path -> (mtime, size, width, height, hash), in scan order
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+        with cache.lock:
+            if cache.db is not None:
+                cache.db.execute(self.schema)
+
+    def stored(self):
+        cache = self.cache
+        with cache.lock:
+            if cache.db is None:
+                return {}
+            return {
+                row[0]: row[1:]
+                for row in cache.db.execute(
+                    "SELECT path, mtime, size, width, height, hash FROM assets"
+                )
+            }
+
+    def update(self, paths):
+        # paths are all the assets of a scan. Unchanged files (same mtime and
+        # size) keep their entry, new and modified ones are described again
+        # and files that are gone are dropped.
+        cache = self.cache
+        stored = self.stored()
+        entries, changed = {}, []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+
+            key = cache.key(path)
+            entry = stored.pop(key, None)
+            if entry is None or entry[:2] != (stat.st_mtime_ns, stat.st_size):
+                try:
+                    entry = describeAsset(path, stat)
+                except OSError as e:
+                    print(f"Could not index {path}: {e}")
+                    continue
+                changed.append((key, os.path.basename(path)) + entry)
+                self.misses += 1
+            else:
+                self.hits += 1
+            entries[path] = entry
+
+        self.entries = entries
+
+        with cache.lock:
+            if cache.db is None:
+                return
+            cache.db.executemany(
+                "INSERT OR REPLACE INTO assets VALUES (?, ?, ?, ?, ?, ?, ?)", changed
+            )
+            cache.db.executemany(
+                "DELETE FROM assets WHERE path = ?", [(key,) for key in stored]
+            )
+            cache.commit()
+
+    def refresh(self, path):
+        # re-describes a single asset, e.g. after it changed on disk. Returns
+        # None (and forgets the asset) if it cannot be read.
+        cache = self.cache
+        try:
+            entry = describeAsset(path, os.stat(path))
+        except OSError:
+            entry = None
+
+        with cache.lock:
+            if entry is None:
+                self.entries.pop(path, None)
+                if cache.db is not None:
+                    cache.db.execute(
+                        "DELETE FROM assets WHERE path = ?", (cache.key(path),)
+                    )
+                    cache.commit()
+                return None
+
+            self.entries[path] = entry
+            if cache.db is not None:
+                cache.db.execute(
+                    "INSERT OR REPLACE INTO assets VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (cache.key(path), os.path.basename(path)) + entry,
+                )
+                cache.commit()
+        return entry
+
+    def size(self, path):
+        # (width, height) of the asset, assets that were not indexed yet are
+        # described on first use
+        entry = self.entries.get(path, None)
+        if entry is None:
+            entry = self.refresh(path)
+            if entry is None:
+                raise FileNotFoundError(path)
+        return entry[2], entry[3]
+
+    def hash(self, path):
+        entry = self.entries.get(path, None)
+        return None if entry is None else entry[4]
+
+    def duplicates(self):
+        # basename -> paths, for every basename shared by several assets
+        byName = {}
+        for path in self.entries:
+            byName.setdefault(os.path.basename(path), []).append(path)
+        return {name: paths for name, paths in byName.items() if len(paths) > 1}
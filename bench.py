@@ -0,0 +1,355 @@
+import os, sys, json, time, platform, shutil, statistics, tempfile
+import numpy as np
+from PIL import Image
+
+# Headless benchmarks of the hot paths, on a generated asset tree and sheet:
+#
+#   python bench.py [--assets=<n>] [--sheet=<cells>] [--ops=<n>] [--repeat=<n>]
+#                   [--seed=<n>] [--dir=<path>] [--out=<results.json>]
+#                   [--baseline=<results.json>] [--tolerance=<fraction>]
+#
+# Everything is generated from the seed, so runs with the same arguments
+# work on the same assets and placements. Results are written as JSON (the
+# seconds of every run per benchmark), with --baseline the medians are
+# compared against an earlier results file and the exit status is 1 if a
+# benchmark got slower by more than the tolerance. Qt runs on the offscreen
+# platform unless QT_QPA_PLATFORM says otherwise.
+
+# (width, height) of the generated assets in pixels and their share
+assetShapes = [
+    ((16, 16), 0.5),
+    ((16, 32), 0.1),
+    ((32, 16), 0.1),
+    ((32, 32), 0.15),
+    ((48, 32), 0.05),
+    ((32, 48), 0.05),
+    ((64, 64), 0.05),
+]
+tileSize = 16
+
+defaults = {
+    "assets": 1000,
+    "sheet": 256,
+    "ops": 5000,
+    "repeat": 5,
+    "seed": 0,
+    "tolerance": 0.2,
+}
+
+
+def makeAssets(root, count, rng):
+    # count assets in a tree of 2 levels below root: blocky colors with
+    # transparent holes, compressing roughly like drawn assets do
+    shapes = [shape for shape, _ in assetShapes]
+    weights = [weight for _, weight in assetShapes]
+    paths = []
+    for i, shape in enumerate(rng.choice(len(shapes), size=count, p=weights)):
+        w, h = shapes[shape]
+        blocks = rng.integers(0, 256, (h // 4, w // 4, 4), dtype=np.uint8)
+        blocks[..., 3] = np.where(blocks[..., 3] < 64, 0, 255)
+        pixels = blocks.repeat(4, axis=0).repeat(4, axis=1)
+
+        directory = os.path.join(root, f"group{i // 100}", f"set{i // 20 % 5}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"asset{i}.png")
+        Image.fromarray(pixels, "RGBA").save(path)
+        paths.append(path)
+    return paths
+
+
+def makeLayout(paths, side, count, rng):
+    # up to count non-overlapping placements [(pos, path, size, rotation,
+    # flipH, flipV)] on a side x side sheet, in the order they were found
+    from sheet import cellEntries
+
+    sizes = {path: Image.open(path).size for path in paths}
+    entries = cellEntries(tileSize, side, side)
+    layout = []
+    for _ in range(count * 4):
+        if len(layout) == count:
+            break
+        path = paths[int(rng.integers(len(paths)))]
+        rotation = int(rng.choice([0, 90, 180, 270]))
+        w, h = sizes[path]
+        if rotation in (90, 270):
+            w, h = h, w
+        pos = int(rng.integers(side)), int(rng.integers(side))
+        if entries.checkOverlaps(pos, w, h):
+            continue
+        flipH, flipV = bool(rng.integers(2)), bool(rng.integers(2))
+        entries.place(pos, path, w, h, rotation, flipH, flipV)
+        layout.append((pos, path, sizes[path], rotation, flipH, flipV))
+    return layout
+
+
+def fillSheet(layout):
+    from sheet import cellEntries
+
+    entries = cellEntries(tileSize, settings["sheet"], settings["sheet"])
+    for pos, path, size, rotation, flipH, flipV in layout:
+        entries.add(pos, path, rotation, flipH, flipV, size=size)
+    return entries
+
+
+def timeRuns(run, setup=None):
+    # seconds of every run, setup is called untimed before each
+    runs = []
+    for _ in range(settings["repeat"]):
+        state = setup() if setup is not None else None
+        start = time.perf_counter()
+        run(state)
+        runs.append(time.perf_counter() - start)
+    return runs
+
+
+def benchModel(results, layout, baseToPath, rng):
+    from sheet import newSheetImage
+
+    side = settings["sheet"]
+    results["cellEntries.add"] = (len(layout), timeRuns(lambda _: fillSheet(layout)))
+
+    probes = [
+        ((int(rng.integers(side)), int(rng.integers(side))), (16, 32))
+        for _ in range(settings["ops"])
+    ]
+    results["checkOverlaps"] = (
+        len(probes),
+        timeRuns(
+            lambda entries: [entries.checkOverlaps(p, *size) for p, size in probes],
+            lambda: fillSheet(layout),
+        ),
+    )
+
+    order = [layout[i][0] for i in rng.permutation(len(layout))]
+    results["deleteCell"] = (
+        len(order),
+        timeRuns(
+            lambda entries: [entries.deleteCell(pos) for pos in order],
+            lambda: fillSheet(layout),
+        ),
+    )
+
+    def drawAll(state):
+        entries, image = state
+        for pos, *_ in layout:
+            entries.drawCell(pos, image, baseToPath)
+
+    entries = fillSheet(layout)
+    results["drawCell"] = (
+        len(layout),
+        timeRuns(drawAll, lambda: (entries, newSheetImage(entries))),
+    )
+
+
+def benchEditor(results, root, sheetName, layout, rng):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5 import QtWidgets
+    from gui import MainWindow
+    from thumbcache import cacheName
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    windows = []
+
+    def openWindow():
+        window = MainWindow()
+        window.show()
+        windows.append(window)
+        return window.content
+
+    def closeWindows():
+        while windows:
+            window = windows.pop()
+            # indexing goes on in the background after a scan
+            window.content.scanner.pool.shutdown(wait=True)
+            window.content.scanner.stop()
+            window.close()
+            window.deleteLater()
+        app.processEvents()
+
+    def scan(content):
+        content.loadDirectory(root)
+        content.waitForScan()
+
+    def coldScan(_):
+        closeWindows()
+        cache = os.path.join(root, cacheName)
+        for path in (cache, f"{cache}-wal", f"{cache}-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+        return openWindow()
+
+    def warmScan(_):
+        closeWindows()
+        return openWindow()
+
+    results["loadDirectory (cold)"] = (1, timeRuns(scan, lambda: coldScan(None)))
+    results["loadDirectory"] = (1, timeRuns(scan, lambda: warmScan(None)))
+
+    def scanned():
+        content = warmScan(None)
+        scan(content)
+        return content
+
+    results["Content.load"] = (1, timeRuns(lambda c: c.load(sheetName), scanned))
+
+    content = scanned()
+    content.load(sheetName)
+    s = tileSize
+    boxes = []
+    for _ in range(min(settings["ops"], 1000)):
+        pos = layout[int(rng.integers(len(layout)))][0]
+        boxes.append((pos[0] * s, pos[1] * s, pos[0] * s + 32, pos[1] * s + 32))
+
+    def updateAll(_):
+        # the repaint of every dirty box is included
+        for box in boxes:
+            content.updateImage(box)
+            app.processEvents()
+
+    results["updateImage"] = (len(boxes), timeRuns(updateAll))
+
+    # adding or removing a tile before every run makes the sheet need saving
+    pos = (0, 0)
+    content.selectItem(content.items[0])
+
+    def changed():
+        if content.cellEntries.hasCell(pos):
+            content.removeTile(*pos)
+        else:
+            content.addTile(*pos)
+
+    results["save"] = (1, timeRuns(lambda _: content.save(), changed))
+    results["save (unchanged)"] = (1, timeRuns(lambda _: content.save()))
+    closeWindows()
+
+
+def benchDarken(results, imagePath):
+    from run import commandDarken
+
+    results["commandDarken"] = (
+        1,
+        timeRuns(
+            lambda _: commandDarken("darken", imagePath, "0.2", "0.1", "0", "0.5")
+        ),
+    )
+
+
+def summary(ops, runs):
+    median = statistics.median(runs)
+    return {
+        "ops": ops,
+        "runs": runs,
+        "best": min(runs),
+        "median": median,
+        "perOp": median / ops,
+    }
+
+
+def compare(results, baseline, tolerance):
+    # prints the medians against the baseline's, returns the names of the
+    # benchmarks that got slower by more than tolerance
+    slower = []
+    for name, result in results.items():
+        before = baseline["results"].get(name, None)
+        if before is None:
+            print(f"{name:24} {result['median'] * 1000:10.2f} ms  (new)")
+            continue
+        ratio = result["median"] / before["median"]
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag = "  SLOWER"
+            slower.append(name)
+        print(
+            f"{name:24} {result['median'] * 1000:10.2f} ms  "
+            f"baseline {before['median'] * 1000:10.2f} ms  x{ratio:.2f}{flag}"
+        )
+    return slower
+
+
+def parseArgs(args):
+    parsed = dict(defaults)
+    for arg in args:
+        if not arg.startswith("--") or "=" not in arg:
+            sys.exit(f"Unknown argument {arg}, see the top of bench.py")
+        key, value = arg[2:].split("=", 1)
+        if key in ("dir", "out", "baseline"):
+            parsed[key] = value
+        elif key == "tolerance":
+            parsed[key] = float(value)
+        elif key in defaults:
+            parsed[key] = int(value)
+        else:
+            sys.exit(f"Unknown argument {arg}, see the top of bench.py")
+    return parsed
+
+
+settings = dict(defaults)
+
+
+def main(args):
+    settings.update(parseArgs(args))
+    rng = np.random.default_rng(settings["seed"])
+
+    workDir = settings.get("dir", None) or tempfile.mkdtemp(prefix="tsm-bench-")
+    root = os.path.join(workDir, "assets")
+    sheetName = os.path.join(workDir, "bench")
+    try:
+        shutil.rmtree(root, ignore_errors=True)
+        paths = makeAssets(root, settings["assets"], rng)
+        layout = makeLayout(paths, settings["sheet"], settings["ops"], rng)
+        baseToPath = {os.path.basename(p): p for p in paths}
+
+        from sheet import newSheetImage, renderSheet, sheetPaths
+
+        entries = fillSheet(layout)
+        cellEntriesPath, imagePath = sheetPaths(sheetName)
+        entries.save(cellEntriesPath)
+        renderSheet(entries, newSheetImage(entries), baseToPath).save(imagePath)
+
+        results = {}
+        benchModel(results, layout, baseToPath, rng)
+        benchEditor(results, root, sheetName, layout, rng)
+        benchDarken(results, imagePath)
+    finally:
+        if "dir" not in settings:
+            shutil.rmtree(workDir, ignore_errors=True)
+
+    import PIL
+    from PyQt5.QtCore import QT_VERSION_STR
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "numpy": np.__version__,
+            "pillow": PIL.__version__,
+            "qt": QT_VERSION_STR,
+            "settings": settings,
+            "placements": len(layout),
+        },
+        "results": {name: summary(*result) for name, result in results.items()},
+    }
+
+    out = settings.get("out", None) or f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    with open(out, "w") as fil:
+        json.dump(report, fil, indent=2)
+
+    slower = []
+    if "baseline" in settings:
+        with open(settings["baseline"]) as fil:
+            baseline = json.load(fil)
+        slower = compare(report["results"], baseline, settings["tolerance"])
+    else:
+        for name, result in report["results"].items():
+            print(
+                f"{name:24} {result['median'] * 1000:10.2f} ms  "
+                f"{result['perOp'] * 1e6:10.1f} us/op"
+            )
+    print(f"Results written to {out}")
+    return 1 if slower else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,160 @@
+import hashlib, struct
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+import numpy as np
+from imagecache import orientations
+
+# Assets are equivalent when one is a rotated and/or flipped version of the
+# other, pixel for pixel. Every asset is hashed in all 8 orientations, the
+# smallest of the 8 digests is the same for all assets of a group, so groups
+# fall out of a dict lookup instead of pairwise comparisons.
+
+digestSize = 16
+
+
+# (height, width) -> (permutations, prefixes), see orientationTables
+tables = {}
+
+
+def orientationTables(height, width):
+    # for every orientation, the order in which the pixels of a height x
+    # width image are read to get the oriented image, and the packed size of
+    # the oriented image that goes into its digest
+    key = height, width
+    if key not in tables:
+        positions = np.arange(height * width).reshape(height, width)
+        permutations, prefixes = [], []
+        for rotation, flipH, _ in orientations:
+            # np.rot90 turns counter-clockwise like transform() does
+            oriented = np.rot90(positions, rotation // 90)
+            if flipH:
+                oriented = oriented[:, ::-1]
+            permutations.append(oriented.ravel())
+            prefixes.append(struct.pack("<II", *oriented.shape))
+        tables[key] = np.stack(permutations), prefixes
+    return tables[key]
+
+
+def orientationHashes(path):
+    # the digests of the asset's pixels in each of imagecache.orientations,
+    # concatenated. Fully transparent pixels all hash the same, whatever
+    # their color.
+    pixels = np.array(Image.open(path).convert("RGBA"))
+    pixels[pixels[..., 3] == 0] = 0
+
+    # one gather builds all 8 orientations, an RGBA pixel read as one uint32
+    permutations, prefixes = orientationTables(*pixels.shape[:2])
+    oriented = pixels.view(np.uint32).reshape(-1)[permutations]
+
+    digests = []
+    for prefix, row in zip(prefixes, oriented):
+        digest = hashlib.blake2b(prefix, digest_size=digestSize)
+        digest.update(row.data)
+        digests.append(digest.digest())
+    return b"".join(digests)
+
+
+def splitHashes(hashes):
+    return [hashes[i : i + digestSize] for i in range(0, len(hashes), digestSize)]
+
+
+def decodeHashes(path):
+    # orientationHashes, None if the file cannot be decoded
+    try:
+        return orientationHashes(path)
+    except OSError as e:
+        print(f"Could not hash {path}: {e}")
+        return None
+
+
+class orientationHashIndex:
+    # orientationHashes persisted in a cacheFile, keyed by the content hash
+    # of the asset index so byte-identical files are only decoded once and
+    # unchanged files never again
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS orientationHashes (
+            hash TEXT PRIMARY KEY,
+            hashes BLOB NOT NULL
+        )
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+
+        with cache.lock:
+            if cache.db is not None:
+                cache.db.execute(self.schema)
+
+    def stored(self):
+        cache = self.cache
+        with cache.lock:
+            if cache.db is None:
+                return {}
+            return dict(cache.db.execute("SELECT hash, hashes FROM orientationHashes"))
+
+    def hashes(self, index, paths, workers=None):
+        # {path: orientationHashes(path)} for paths of an up to date
+        # assetIndex, decoding is done by a thread pool. Paths the index has
+        # no entry for (unreadable files) or that cannot be decoded are left
+        # out.
+        stored = self.stored()
+        indexed = [path for path in paths if index.hash(path) is not None]
+        missing = {}
+        for path in indexed:
+            content = index.hash(path)
+            if content not in stored:
+                missing.setdefault(content, path)
+        self.misses += len(missing)
+        self.hits += len(indexed) - len(missing)
+
+        with ThreadPoolExecutor(workers) as pool:
+            decoded = pool.map(decodeHashes, missing.values())
+            computed = {
+                content: hashes
+                for content, hashes in zip(missing, decoded)
+                if hashes is not None
+            }
+        stored.update(computed)
+
+        cache = self.cache
+        with cache.lock:
+            if cache.db is not None and computed:
+                cache.db.executemany(
+                    "INSERT OR REPLACE INTO orientationHashes VALUES (?, ?)",
+                    computed.items(),
+                )
+                cache.commit()
+
+        return {
+            path: stored[index.hash(path)]
+            for path in indexed
+            if index.hash(path) in stored
+        }
+
+
+def findDuplicates(paths, hashes):
+    # groups of equivalent assets as [(path, (rotation, flipH, flipV)), ...].
+    # The first asset of a group (in the order of paths) is its
+    # representative, every other one is transform(representative, *o).
+    # Paths without hashes are skipped.
+    byKey = {}
+    for path in paths:
+        if path not in hashes:
+            continue
+        digests = splitHashes(hashes[path])
+        byKey.setdefault(min(digests), []).append((path, digests))
+
+    groups = []
+    for members in byKey.values():
+        if len(members) < 2:
+            continue
+        representative, digests = members[0]
+        group = [(representative, orientations[0])]
+        for path, own in members[1:]:
+            # the orientation of the representative that looks like path
+            group.append((path, orientations[digests.index(own[0])]))
+        groups.append(group)
+    return groups
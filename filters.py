@@ -0,0 +1,284 @@
+import os, math, time
+from PIL import Image
+import numpy as np
+
+# Color filters for finished sheets, see run.commandFilter. A variant is a
+# name and a chain of operations:
+#
+#   tint=<r>,<g>,<b>,<a>      blend the color in with alpha a, as darken does
+#   brightness=<factor>       scale r, g and b
+#   hue=<degrees>             rotate the hue (like CSS hue-rotate)
+#   palette=<from>,<to>       replace every color of the palette image from
+#                             with the color at the same pixel of to
+#   threshold=<a>             make alpha 0 below a (0-1) and opaque above
+#
+# Pixels that are fully transparent in the input are left as they are by
+# every operation. Operations that map every channel on its own (tint,
+# brightness, threshold) are 256 entry tables, a run of them is folded into
+# one set of tables before any pixel is touched.
+
+# kind -> types of its arguments
+opArgs = {
+    "tint": (float, float, float, float),
+    "brightness": (float,),
+    "hue": (float,),
+    "palette": (str, str),
+    "threshold": (float,),
+}
+
+darkenChunkRows = 256
+
+
+def darkenTables(r, g, b, a):
+    # every output channel only depends on the matching input channel, so the
+    # per-pixel blend collapses into one 256 entry table per channel. The
+    # tables are evaluated with the exact float64 expressions of the old
+    # per-pixel loop, which keeps the output byte-identical to it.
+    values = np.arange(256) / 255
+    tables = [np.uint8((c * a + values * (1 - a)) * 255) for c in (r, g, b)]
+    tables.append(np.uint8((a + values - a * values) * 255))
+    return tables
+
+
+def darken(image, r, g, b, a, chunkRows=None):
+    # 0-alpha pixels are left untouched, everything else gets the color
+    # blended in and the alpha combined as p = a + p1 - a*p1 (see bottom).
+    # Rows are processed in chunks so the temporaries stay small even on
+    # 8192x8192 sheets.
+    chunkRows = chunkRows or darkenChunkRows
+    tables = darkenTables(r, g, b, a)
+    pixels = np.array(image, dtype=np.uint8)
+
+    for start in range(0, pixels.shape[0], chunkRows):
+        chunk = pixels[start : start + chunkRows]
+        visible = chunk[..., 3] != 0
+        for channel, table in enumerate(tables):
+            values = chunk[..., channel]
+            values[visible] = table[values[visible]]
+
+    return Image.fromarray(pixels)
+
+
+def parseVariant(spec):
+    # "<name>:<op>[+<op>...]" -> (name, [(kind, args)]), raises ValueError
+    # when spec is not valid
+    name, _, chain = spec.partition(":")
+    if not name or not chain:
+        raise ValueError(f"Variant {spec} is not <name>:<op>[+<op>...]")
+    ops = []
+    for op in chain.split("+"):
+        kind, _, args = op.partition("=")
+        if kind not in opArgs:
+            raise ValueError(
+                f"Unknown operation {kind}, use one of {', '.join(opArgs)}"
+            )
+        types = opArgs[kind]
+        args = args.split(",") if args else []
+        if len(args) != len(types):
+            raise ValueError(f"{kind} takes {len(types)} arguments, got {op}")
+        try:
+            ops.append((kind, tuple(t(arg) for t, arg in zip(types, args))))
+        except ValueError:
+            raise ValueError(f"Invalid arguments in {op}")
+    return name, ops
+
+
+def brightnessTables(factor):
+    values = np.arange(256)
+    table = np.uint8(np.clip(np.rint(values * factor), 0, 255))
+    return [table, table, table, None]
+
+
+def thresholdTables(a):
+    values = np.arange(256)
+    return [None, None, None, np.where(values >= a * 255, 255, 0).astype(np.uint8)]
+
+
+def foldTables(first, second):
+    # the tables doing first and then second
+    folded = []
+    for a, b in zip(first, second):
+        if a is None or b is None:
+            folded.append(b if a is None else a)
+        else:
+            folded.append(b[a])
+    return folded
+
+
+def hueMatrix(degrees):
+    # the hue-rotate matrix of the CSS filter effects spec, rotates around
+    # the luminance axis so the brightness of a color stays about the same
+    c, s = math.cos(math.radians(degrees)), math.sin(math.radians(degrees))
+    return np.array(
+        [
+            [
+                0.213 + c * 0.787 - s * 0.213,
+                0.715 - c * 0.715 - s * 0.715,
+                0.072 - c * 0.072 + s * 0.928,
+            ],
+            [
+                0.213 - c * 0.213 + s * 0.143,
+                0.715 + c * 0.285 + s * 0.140,
+                0.072 - c * 0.072 - s * 0.283,
+            ],
+            [
+                0.213 - c * 0.213 - s * 0.787,
+                0.715 - c * 0.715 + s * 0.715,
+                0.072 + c * 0.928 + s * 0.072,
+            ],
+        ],
+        dtype=np.float32,
+    ).T
+
+
+# (from, to) -> (sorted source colors, target colors), see paletteColors
+palettes = {}
+
+
+def paletteColors(fromPath, toPath):
+    # the colors of fromPath as sorted uint32s, and the color each of them
+    # is replaced with. A color appearing more than once maps to the first.
+    key = fromPath, toPath
+    if key not in palettes:
+        source = np.array(Image.open(fromPath).convert("RGBA"))
+        target = np.array(Image.open(toPath).convert("RGBA"))
+        if source.shape != target.shape:
+            raise ValueError(f"Palettes {fromPath} and {toPath} differ in size")
+        source = source.view(np.uint32).reshape(-1)
+        target = target.view(np.uint32).reshape(-1)
+        colors, first = np.unique(source, return_index=True)
+        palettes[key] = colors, target[first]
+    return palettes[key]
+
+
+def compileChain(ops):
+    # [(kind, args)] -> steps, a step being either channel tables (None for
+    # a channel that is not changed) or ("tint", tables) / ("hue", matrix) /
+    # ("palette", colors, replacements)
+    steps = []
+    # whether a step so far may have changed alpha. Until then the visible
+    # pixels are the ones of the input, which filterVariants restores, so a
+    # tint can be folded; after it a tint has to skip the pixels that are
+    # transparent by then, as darken does.
+    alphaChanged = False
+    for kind, args in ops:
+        if kind == "tint":
+            step = darkenTables(*args)
+            if alphaChanged:
+                steps.append(("tint", step))
+                continue
+        elif kind == "brightness":
+            step = brightnessTables(*args)
+        elif kind == "threshold":
+            step = thresholdTables(*args)
+        elif kind == "hue":
+            steps.append(("hue", hueMatrix(*args)))
+            continue
+        else:
+            steps.append(("palette",) + paletteColors(*args))
+            alphaChanged = True
+            continue
+        alphaChanged = alphaChanged or step[3] is not None
+        if steps and isinstance(steps[-1], list):
+            steps[-1] = foldTables(steps[-1], step)
+        else:
+            steps.append(step)
+    return steps
+
+
+def applyStep(step, band):
+    # applies step to band, a (rows, width, 4) C-contiguous array, in place
+    if isinstance(step, list):
+        for channel, table in enumerate(step):
+            if table is not None:
+                band[..., channel] = table[band[..., channel]]
+    elif step[0] == "tint":
+        visible = band[..., 3] != 0
+        for channel, table in enumerate(step[1]):
+            values = band[..., channel]
+            values[visible] = table[values[visible]]
+    elif step[0] == "hue":
+        rgb = band[..., :3] @ step[1]
+        band[..., :3] = np.clip(np.rint(rgb), 0, 255)
+    else:
+        _, colors, replacements = step
+        keys = band.view(np.uint32)[..., 0]
+        found = np.minimum(np.searchsorted(colors, keys), len(colors) - 1)
+        match = colors[found] == keys
+        keys[match] = replacements[found[match]]
+
+
+def filterVariants(pixels, chains, chunkRows=None):
+    # the RGBA pixels with each of chains (see compileChain) applied. Rows
+    # are processed in chunks and every chain is run on a chunk before
+    # moving on, so the input is read from memory once for all variants.
+    chunkRows = chunkRows or darkenChunkRows
+    outputs = [np.empty_like(pixels) for _ in chains]
+    for start in range(0, pixels.shape[0], chunkRows):
+        chunk = pixels[start : start + chunkRows]
+        hidden = chunk[..., 3] == 0
+        for steps, out in zip(chains, outputs):
+            band = out[start : start + chunkRows]
+            band[...] = chunk
+            for step in steps:
+                applyStep(step, band)
+            band[hidden] = chunk[hidden]
+    return outputs
+
+
+def variantPath(path, name):
+    return f"{os.path.splitext(path)[0]}_{name}.png"
+
+
+def isVariant(path, variants):
+    # whether path was written by one of variants
+    stem = os.path.splitext(path)[0]
+    return any(stem.endswith(f"_{name}") for name, _ in variants)
+
+
+def filterFile(path, variants, compression=None, workers=None):
+    # decodes the image at path once and writes every (name, ops) of
+    # variants next to it, returns (path, written paths, seconds). sheet is
+    # only imported here, darken does not need it.
+    from sheet import addSheetVariants, saveSheetImage, sheetPaths
+
+    start = time.perf_counter()
+    pixels = np.array(Image.open(path).convert("RGBA"))
+    chains = [compileChain(ops) for _, ops in variants]
+    written = []
+    for (name, _), out in zip(variants, filterVariants(pixels, chains)):
+        outPath = variantPath(path, name)
+        saveSheetImage(Image.fromarray(out, "RGBA"), outPath, compression, workers)
+        written.append(outPath)
+
+    # variants of a sheet are not assets, see isSheetImage
+    sheetPath, _ = sheetPaths(path)
+    if os.path.exists(sheetPath):
+        addSheetVariants(sheetPath, [name for name, _ in variants])
+    return path, written, time.perf_counter() - start
+
+
+def filterFiles(paths, variants, compression=None, workers=None):
+    # yields filterFile of every path as they finish, on a pool of workers
+    # processes (one per core by default). Every process saves its images
+    # on one thread, the pool already keeps the cores busy.
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+    if workers <= 1:
+        for path in paths:
+            yield filterFile(path, variants, compression)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [
+            pool.submit(filterFile, path, variants, compression, 1) for path in paths
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+# 1 - p = (1 - p1) * (1-p2)
+# p = 1 - (1 - p1) * (1-p2)
+# p = 1 - 1 + p2 + p1 - p1*p2
+# ==> p = p2 + p1 - p1*p2
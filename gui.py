@@ -0,0 +1,1063 @@
+import sys, os
+from PyQt5 import QtCore, QtGui, QtWidgets
+from PyQt5.QtGui import QKeySequence
+from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QTreeWidgetItem, QShortcut
+from window import Ui_Form
+from PIL.ImageQt import ImageQt
+from PIL import Image
+from imagecache import images, lruCache, openVariant, variants
+from thumbcache import cacheFile, thumbnailCache
+from assetindex import assetIndex
+from journal import sheetJournal
+from history import editHistory
+from sheet import (
+    cellEntries,
+    addAsset,
+    loadSheet,
+    newSheetImage,
+    renderSheet,
+    saveSheetImage,
+    sheetImageStale,
+    sheetPaths,
+    transformLabel,
+    unusedAssets,
+    walkAssets,
+)
+from concurrent.futures import ThreadPoolExecutor
+
+# Budget of the canvas' cache of converted sheet chunks, in bytes. Can be
+# overridden with TSM_CANVAS_CACHE_MB.
+canvasBudget = int(os.environ.get("TSM_CANVAS_CACHE_MB", 256)) * 1024 * 1024
+
+# Budget of the canvas' cache of scaled tiles, for all zoom levels together,
+# in bytes. Can be overridden with TSM_ZOOM_CACHE_MB.
+zoomBudget = int(os.environ.get("TSM_ZOOM_CACHE_MB", 128)) * 1024 * 1024
+
+
+#  https://stackoverflow.com/questions/34697559/pil-image-to-qpixmap-conversion-issue
+def pil2pixmap(im):
+    if im.mode == "RGB":
+        r, g, b = im.split()
+        im = Image.merge("RGB", (b, g, r))
+
+    elif im.mode == "RGBA":
+        r, g, b, a = im.split()
+        im = Image.merge("RGBA", (b, g, r, a))
+
+    elif im.mode == "L":
+        im = im.convert("RGBA")
+
+    # Bild in RGBA konvertieren, falls nicht bereits passiert
+    im2 = im.convert("RGBA")
+    data = im2.tobytes("raw", "RGBA")
+    qim = QtGui.QImage(data, im.size[0], im.size[1], QtGui.QImage.Format_ARGB32)
+    pixmap = QtGui.QPixmap.fromImage(qim)
+    return pixmap
+
+
+class sheetCanvas(QtWidgets.QWidget):
+    # Custom-painted view of the sheet. A paintEvent only draws the exposed
+    # part: the sheet chunks under it, the grid lines and the highlights.
+    # Clicks are mapped to cells arithmetically.
+    #
+    # Converted chunks of the sheet are cached at 1:1 (chunks) and, cut into
+    # tiles of at most chunkSize screen pixels, as pixmaps per zoom level
+    # (scaled). Painting, scrolling and switching back to a zoom level only
+    # blit those pixmaps, edits patch both caches in place.
+
+    gridColor = QtGui.QColor("#BCBCBC")
+    hoverColor = QtGui.QColor("#88C8EDFF")
+    highlightColor = QtGui.QColor(0, 0, 255, 200)
+
+    # sheet pixels per side of a cached chunk
+    chunkSize = 256
+    # screen pixels per cell below which grid lines are left out
+    minGridSpacing = 4
+
+    def __init__(self, parent=None, content=None):
+        super().__init__(parent)
+        self.content = content
+        self.image = None
+        self.tileSize = 16
+        self.scale = 1
+        self.hovered = None
+        self.chunks = lruCache(canvasBudget)
+        self.scaled = lruCache(zoomBudget)
+        self.setMouseTracking(True)
+
+    def setImage(self, image, tileSize):
+        self.image = image
+        self.tileSize = tileSize
+        self.chunks.clear()
+        self.scaled.clear()
+        self.updateSize()
+
+    def setScale(self, scale):
+        self.scale = scale
+        self.updateSize()
+
+    def updateSize(self):
+        if self.image is None:
+            return
+        w, h = self.image.size
+        self.setFixedSize(w * self.scale, h * self.scale)
+        self.update()
+
+    def cellSize(self):
+        return self.tileSize * self.scale
+
+    def cellAt(self, point):
+        s = self.cellSize()
+        x, y = point.x() // s, point.y() // s
+        w, h = self.image.size
+        if 0 <= x < w // self.tileSize and 0 <= y < h // self.tileSize:
+            return x, y
+        return None
+
+    def cellRect(self, cell):
+        s = self.cellSize()
+        return QtCore.QRect(cell[0] * s, cell[1] * s, s, s)
+
+    def clip(self, box):
+        w, h = self.image.size
+        x1, y1 = max(box[0], 0), max(box[1], 0)
+        x2, y2 = min(box[2], w), min(box[3], h)
+        if x1 >= x2 or y1 >= y2:
+            return None
+        return x1, y1, x2, y2
+
+    def chunkRange(self, x1, y1, x2, y2, side=None):
+        c = side or self.chunkSize
+        for cx in range(x1 // c, (x2 - 1) // c + 1):
+            for cy in range(y1 // c, (y2 - 1) // c + 1):
+                yield cx, cy
+
+    def chunkBox(self, cx, cy, side=None):
+        c = side or self.chunkSize
+        return self.clip((cx * c, cy * c, (cx + 1) * c, (cy + 1) * c))
+
+    def tileSide(self, scale):
+        # sheet pixels per side of a scaled tile, a power of two fraction of
+        # chunkSize so every tile lies within one chunk
+        side = self.chunkSize
+        while side * scale > self.chunkSize and side > 1:
+            side //= 2
+        return side
+
+    def chunk(self, cx, cy):
+        image = self.chunks.get((cx, cy))
+        if image is None:
+            # premultiplied, the format pixmaps are drawn from and into
+            image = ImageQt(self.image.crop(self.chunkBox(cx, cy))).convertToFormat(
+                QtGui.QImage.Format_ARGB32_Premultiplied
+            )
+            self.chunks.put((cx, cy), image, image.byteCount())
+        return image
+
+    def scaledTile(self, scale, tx, ty):
+        key = (scale, tx, ty)
+        pixmap = self.scaled.get(key)
+        if pixmap is None:
+            x1, y1, x2, y2 = self.chunkBox(tx, ty, self.tileSide(scale))
+            pixmap = QtGui.QPixmap((x2 - x1) * scale, (y2 - y1) * scale)
+            # gives the pixmap an alpha channel
+            pixmap.fill(Qt.transparent)
+            self.drawScaled(pixmap, scale, (x1, y1), (x1, y1, x2, y2))
+            self.scaled.put(key, pixmap, pixmap.width() * pixmap.height() * 4)
+        return pixmap
+
+    def invalidate(self, box=None):
+        # box is the dirty (x1, y1, x2, y2) region of the sheet in pixels.
+        # Cached chunks under it are patched in place, everything else is
+        # converted lazily once it gets exposed.
+        if box is None:
+            self.chunks.clear()
+            self.scaled.clear()
+            self.update()
+            return
+
+        box = self.clip(box)
+        if box is None:
+            return
+
+        for cx, cy in self.chunkRange(*box):
+            if (cx, cy) not in self.chunks:
+                continue
+            chunk = self.chunks.get((cx, cy))
+            x1, y1, x2, y2 = self.chunkBox(cx, cy)
+            part = (
+                max(box[0], x1),
+                max(box[1], y1),
+                min(box[2], x2),
+                min(box[3], y2),
+            )
+            painter = QtGui.QPainter(chunk)
+            painter.setCompositionMode(QtGui.QPainter.CompositionMode_Source)
+            painter.drawImage(
+                part[0] - x1, part[1] - y1, ImageQt(self.image.crop(part))
+            )
+            painter.end()
+
+        self.patchScaled(box)
+
+        x1, y1, x2, y2 = box
+        s = self.scale
+        self.update(QtCore.QRect(x1 * s, y1 * s, (x2 - x1) * s, (y2 - y1) * s))
+
+    def patchScaled(self, box):
+        # redraws box in the cached tiles of every zoom level, from the
+        # (already patched) chunks
+        with self.scaled.lock:
+            keys = list(self.scaled.entries)
+
+        for scale, tx, ty in keys:
+            x1, y1, x2, y2 = self.chunkBox(tx, ty, self.tileSide(scale))
+            part = (
+                max(box[0], x1),
+                max(box[1], y1),
+                min(box[2], x2),
+                min(box[3], y2),
+            )
+            if part[0] >= part[2] or part[1] >= part[3]:
+                continue
+
+            self.drawScaled(self.scaled.get((scale, tx, ty)), scale, (x1, y1), part)
+
+    def drawScaled(self, pixmap, scale, origin, part):
+        # draws the part (x1, y1, x2, y2) of the sheet (within one chunk) into
+        # pixmap, whose top left corner shows the sheet pixel origin. There
+        # is no smoothing, scaling is nearest neighbour.
+        c = self.chunkSize
+        w, h = part[2] - part[0], part[3] - part[1]
+        painter = QtGui.QPainter(pixmap)
+        painter.setCompositionMode(QtGui.QPainter.CompositionMode_Source)
+        painter.drawImage(
+            QtCore.QRect(
+                (part[0] - origin[0]) * scale,
+                (part[1] - origin[1]) * scale,
+                w * scale,
+                h * scale,
+            ),
+            self.chunk(part[0] // c, part[1] // c),
+            QtCore.QRect(part[0] % c, part[1] % c, w, h),
+        )
+        painter.end()
+
+    def paintEvent(self, event):
+        if self.image is None:
+            return
+
+        rect = event.rect()
+        s = self.scale
+        box = self.clip(
+            (
+                rect.left() // s,
+                rect.top() // s,
+                rect.right() // s + 1,
+                rect.bottom() // s + 1,
+            )
+        )
+        if box is None:
+            return
+
+        painter = QtGui.QPainter(self)
+        side = self.tileSide(s)
+        for tx, ty in self.chunkRange(*box, side=side):
+            painter.drawPixmap(tx * side * s, ty * side * s, self.scaledTile(s, tx, ty))
+
+        self.paintGrid(painter, rect)
+
+        if self.hovered is not None:
+            painter.fillRect(self.cellRect(self.hovered), self.hoverColor)
+
+        for highlight in self.content.highlightRects():
+            if highlight.intersects(rect):
+                painter.fillRect(highlight, self.highlightColor)
+        painter.end()
+
+    def paintGrid(self, painter, rect):
+        s = self.cellSize()
+        if s < self.minGridSpacing:
+            return
+
+        painter.setPen(self.gridColor)
+        right = min(rect.right(), self.width() - 1)
+        bottom = min(rect.bottom(), self.height() - 1)
+        for i in range(rect.left() // s + 1, right // s + 1):
+            painter.drawLine(i * s, rect.top(), i * s, bottom)
+        for j in range(rect.top() // s + 1, bottom // s + 1):
+            painter.drawLine(rect.left(), j * s, right, j * s)
+
+    def setHovered(self, cell):
+        if cell == self.hovered:
+            return
+        for old in (self.hovered, cell):
+            if old is not None:
+                self.update(self.cellRect(old))
+        self.hovered = cell
+
+    def mouseMoveEvent(self, event):
+        self.setHovered(self.cellAt(event.pos()))
+
+    def leaveEvent(self, event):
+        self.setHovered(None)
+
+    def mousePressEvent(self, event):
+        # https://stackoverflow.com/questions/50681354/how-to-add-a-right-click-action-not-menu-to-qtablewidgets-cells
+        cell = self.cellAt(event.pos())
+        if cell is None:
+            return
+
+        if event.button() == QtCore.Qt.LeftButton:
+            self.content.addTile(*cell)
+
+        elif event.button() == QtCore.Qt.RightButton:
+            self.content.removeTile(*cell)
+
+
+class directoryScanner(QtCore.QObject):
+    # Walks an asset directory and decodes tree icons on a thread pool. The
+    # results are handed to the GUI thread through (queued) signals, tagged
+    # with the generation of the scan they belong to. Icons are kept in a
+    # thumbnailCache inside the scanned directory across launches.
+
+    found = QtCore.pyqtSignal(int, list)
+    finished = QtCore.pyqtSignal(int)
+    iconReady = QtCore.pyqtSignal(str, QtGui.QImage)
+    indexed = QtCore.pyqtSignal(int)
+
+    # entries per found signal
+    batchSize = 256
+    # icons are scaled down to fit iconSize x iconSize
+    iconSize = 32
+
+    def __init__(self, parent=None, workers=None):
+        super().__init__(parent)
+        self.pool = ThreadPoolExecutor(workers)
+        self.generation = 0
+        self.cache = None
+        self.thumbnails = None
+        self.index = None
+
+    def scan(self, path):
+        self.generation += 1
+        self.close()
+        self.cache = cacheFile(path)
+        self.thumbnails = thumbnailCache(self.cache, self.iconSize)
+        self.index = assetIndex(self.cache)
+        self.pool.submit(self.walk, path, self.generation, self.index, self.thumbnails)
+        return self.generation
+
+    def walk(self, path, generation, index, thumbnails):
+        batch, assets = [], []
+        try:
+            for entry in walkAssets(path):
+                if generation != self.generation:
+                    return
+                batch.append(entry)
+                if not entry[2]:
+                    assets.append(entry[1])
+                if len(batch) >= self.batchSize:
+                    self.found.emit(generation, batch)
+                    batch = []
+            self.found.emit(generation, batch)
+        finally:
+            self.finished.emit(generation)
+
+        # the tree is complete at this point, the persisted index and
+        # thumbnails are brought up to date afterwards
+        index.update(assets)
+        thumbnails.prune(assets)
+        self.indexed.emit(generation)
+
+    def requestIcon(self, path):
+        self.pool.submit(self.loadIcon, path, self.thumbnails)
+
+    def loadIcon(self, path, thumbnails):
+        # QImage (unlike QPixmap) can be used off the GUI thread
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+
+        cached = thumbnails.get(path, stat)
+        if cached is not None:
+            w, h, pixels = cached
+            image = QtGui.QImage(pixels, w, h, w * 4, QtGui.QImage.Format_RGBA8888)
+            self.iconReady.emit(path, image.copy())
+            return
+
+        image = QtGui.QImage(path)
+        if image.isNull():
+            return
+        size = self.iconSize
+        if max(image.width(), image.height()) > size:
+            image = image.scaled(size, size, Qt.KeepAspectRatio, Qt.FastTransformation)
+        image = image.convertToFormat(QtGui.QImage.Format_RGBA8888)
+        pixels = image.constBits().asstring(image.byteCount())
+        thumbnails.put(path, stat, image.width(), image.height(), pixels)
+        self.iconReady.emit(path, image)
+
+    def stop(self):
+        self.generation += 1
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.close()
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.close()
+
+
+class Content(QtWidgets.QWidget, Ui_Form):
+    scale = 1
+
+    def __init__(self):
+        super().__init__()
+        self.setupUi(self)
+
+        self.canvas = sheetCanvas(self.widget, self)
+        self.verticalLayout_2.replaceWidget(self.label, self.canvas)
+        self.label.hide()
+
+        self.treeWidget.selectionModel().selectionChanged.connect(
+            self.treeSelectionChanged
+        )
+
+        self.treeWidget.itemDoubleClicked.connect(self.updateSelectionHighlight)
+
+        self.scaleSlider.valueChanged.connect(self.scaleChanged)
+
+        self.scanner = directoryScanner(self)
+        self.scanner.found.connect(self.directoryFound)
+        self.scanner.finished.connect(self.scanFinished)
+        self.scanner.iconReady.connect(self.iconReady)
+        self.scanner.indexed.connect(self.assetsIndexed)
+        self.treeWidget.itemExpanded.connect(self.requestVisibleIcons)
+        self.treeWidget.verticalScrollBar().valueChanged.connect(
+            self.requestVisibleIcons
+        )
+
+        # changes are collected for watchDelay ms and handled in one go, see
+        # applyChanges
+        self.watcher = QtCore.QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.directoryChanged)
+        self.watcher.fileChanged.connect(self.fileChanged)
+        self.changedDirectories = set()
+        self.changedFiles = set()
+        self.watchTimer = QtCore.QTimer(self)
+        self.watchTimer.setSingleShot(True)
+        self.watchTimer.setInterval(self.watchDelay)
+        self.watchTimer.timeout.connect(self.applyChanges)
+
+    cellEntries = None
+
+    def scaleChanged(self, scale):
+        self.scale = scale
+        self.applyScale()
+        self.scaleSlider.setValue(scale)
+        self.label_2.setText(f"Scale: {scale}")
+
+    def applyScale(self):
+        self.canvas.setScale(self.scale)
+
+    def newImage(self, tileSize, nRows, nCols):
+        self.tileSize = tileSize
+        if self.cellEntries is None:
+            self.cellEntries = cellEntries(tileSize, nRows, nCols)
+        # memory-mapped for huge sheets, see newSheetImage
+        self.image = newSheetImage(self.cellEntries)
+        self.image.baseX, self.image.baseY = self.image.size
+
+        # self.image = Image.open("Bush_prop_0.png")
+        self.canvas.setImage(self.image, tileSize)
+
+    def load(self, name):
+        if name is None:
+            sys.exit("???")
+
+        self.cellEntriesPath, self.imageSavePath = sheetPaths(name)
+        self.loadCellEntries(self.cellEntriesPath)
+        ce = self.cellEntries
+        self.newImage(ce.tileSize, ce.nRow, ce.nCol)
+
+        if self.scanning:
+            # drawn once the assets are known, see scanFinished
+            self.pendingRender = True
+        else:
+            self.drawSheet()
+        self.indexUnused()
+
+    def drawSheet(self):
+        renderSheet(self.cellEntries, self.image, self.baseToPath)
+        self.updateImage()
+        # the freshly drawn image only needs saving if the one on disk is
+        # out of date, changes to the placements are tracked by cellEntries
+        self.imageChanged = sheetImageStale(
+            self.cellEntries, self.cellEntriesPath, self.imageSavePath, self.baseToPath
+        )
+
+    def updateImage(self, box=None):
+        # box is the dirty (x1, y1, x2, y2) region of self.image in pixels,
+        # without one the whole sheet is redrawn
+        self.canvas.invalidate(box)
+
+    def clearTreeWidget(self):
+        tw = self.treeWidget
+        tw.clear()
+
+    items = []
+    baseToPath = {}
+    treeItems = {}
+    scanning = False
+    scanGeneration = 0
+    pendingRender = False
+    imageChanged = False
+    journal = None
+    history = None
+    # profile the sheet image is saved with, see sheet.saveSheetImage
+    compression = None
+
+    def loadDirectory(self, path):
+        # returns right away, the tree is filled progressively as the scanner
+        # finds assets (directoryFound) and icons are only decoded for rows
+        # that become visible (requestVisibleIcons)
+        self.items = []
+        self.baseToPath = {}
+        self.rootDir = path
+        self.clearTreeWidget()
+        self.treeParents = {path: self.treeWidget}
+        self.treeItems = {}
+        self.iconsRequested = set()
+        self.unwatchAll()
+        self.scanning = True
+        self.scanGeneration = self.scanner.scan(path)
+
+    def directoryFound(self, generation, batch):
+        if generation != self.scanGeneration:
+            return
+
+        for entry in batch:
+            self.addTreeEntry(*entry)
+
+        self.requestVisibleIcons()
+
+    def addTreeEntry(self, directory, fil, isDir):
+        item = QTreeWidgetItem(self.treeParents[directory], [os.path.basename(fil)])
+        if isDir:
+            item.oriPath = None
+            self.treeParents[fil] = item
+        else:
+            item.oriPath = fil
+            self.treeItems[fil] = item
+            # duplicates are reported from the index, see assetsIndexed
+            addAsset(self.items, self.baseToPath, fil, report=False)
+
+    def scanFinished(self, generation):
+        if generation != self.scanGeneration:
+            return
+
+        self.scanning = False
+        self.indexUnused()
+        if self.pendingRender:
+            self.pendingRender = False
+            self.drawSheet()
+        self.watchAll()
+
+    def assetsIndexed(self, generation):
+        if generation != self.scanGeneration:
+            return
+
+        for paths in self.scanner.index.duplicates().values():
+            for fil in paths[1:]:
+                print(f"Duplicate tile name found!:\n- {fil} \n- {paths[0]}")
+
+    def waitForScan(self):
+        while self.scanning:
+            QtWidgets.QApplication.processEvents(QtCore.QEventLoop.AllEvents, 50)
+
+    def requestVisibleIcons(self, *args):
+        tw = self.treeWidget
+        height = tw.viewport().height()
+        item = tw.itemAt(0, 0)
+        while item is not None and tw.visualItemRect(item).top() < height:
+            path = item.oriPath
+            if path is not None and path not in self.iconsRequested:
+                self.iconsRequested.add(path)
+                self.scanner.requestIcon(path)
+            item = tw.itemBelow(item)
+
+    def iconReady(self, path, image):
+        item = self.treeItems.get(path, None)
+        if item is not None:
+            item.setIcon(0, QtGui.QIcon(QtGui.QPixmap.fromImage(image)))
+
+    watchDelay = 250
+
+    def watchAll(self):
+        # directories are watched for assets being added, removed or replaced
+        # (most editors save through a rename), the files of placed assets
+        # for in-place writes
+        self.watcher.addPaths(list(self.treeParents))
+        if self.cellEntries is not None:
+            for name in self.cellEntries.usedImagePaths:
+                self.usageChanged(name, True)
+
+    def unwatchAll(self):
+        paths = self.watcher.directories() + self.watcher.files()
+        if paths:
+            self.watcher.removePaths(paths)
+
+    def usageChanged(self, imagePath, used):
+        # keeps the file watches in line with the placed assets
+        path = self.baseToPath.get(imagePath, None)
+        if self.scanning or path is None:
+            return
+        if used:
+            self.watcher.addPath(path)
+        else:
+            self.watcher.removePath(path)
+
+    def directoryChanged(self, path):
+        self.changedDirectories.add(path)
+        self.watchTimer.start()
+
+    def fileChanged(self, path):
+        self.changedFiles.add(path)
+        self.watchTimer.start()
+
+    def applyChanges(self):
+        if self.scanning:
+            # the scan picks the changes up, rescheduled in case it already
+            # walked past them
+            self.watchTimer.start()
+            return
+
+        directories, self.changedDirectories = self.changedDirectories, set()
+        files, self.changedFiles = self.changedFiles, set()
+
+        changed = set()
+        for directory in sorted(directories):
+            if directory in self.treeParents:
+                changed |= self.rescanDirectory(directory)
+
+        for path in files:
+            if path not in self.treeItems:
+                continue
+            if os.path.exists(path):
+                changed.add(path)
+                # replacing a file drops its watch
+                if path not in self.watcher.files():
+                    self.watcher.addPath(path)
+            elif os.path.dirname(path) not in directories:
+                changed |= self.rescanDirectory(os.path.dirname(path))
+
+        for path in changed:
+            self.assetChanged(path)
+        self.requestVisibleIcons()
+
+    def rescanDirectory(self, directory):
+        # brings the tree in line with one directory. Returns the assets that
+        # were added, removed or modified, including everything below added
+        # and removed subdirectories.
+        changed = set()
+        known = {
+            p
+            for p in list(self.treeItems) + list(self.treeParents)
+            if os.path.dirname(p) == directory
+        }
+
+        for parent, fil, isDir in walkAssets(directory, recursive=False):
+            if fil in known:
+                known.discard(fil)
+                if not isDir and self.isModified(fil):
+                    changed.add(fil)
+                continue
+
+            self.addTreeEntry(parent, fil, isDir)
+            if isDir:
+                self.watcher.addPath(fil)
+                for entry in walkAssets(fil):
+                    self.addTreeEntry(*entry)
+                    if entry[2]:
+                        self.watcher.addPath(entry[1])
+                    else:
+                        changed.add(entry[1])
+            else:
+                changed.add(fil)
+
+        for path in known:
+            changed |= self.removeTreeEntry(path)
+
+        if changed:
+            self.indexUnused()
+        return changed
+
+    def removeTreeEntry(self, path):
+        # drops an asset or a directory with everything below it, returns the
+        # removed assets
+        removed = set()
+        if path in self.treeParents:
+            prefix = path + os.sep
+            for p in [p for p in self.treeItems if p.startswith(prefix)]:
+                removed |= self.removeTreeEntry(p)
+            for p in [p for p in self.treeParents if p.startswith(prefix)]:
+                self.treeParents.pop(p)
+            item = self.treeParents.pop(path)
+            if path in self.watcher.directories():
+                self.watcher.removePath(path)
+        else:
+            item = self.treeItems.pop(path)
+            self.items.remove(path)
+            self.iconsRequested.discard(path)
+            basename = os.path.basename(path)
+            if self.baseToPath.get(basename, None) == path:
+                # falls back on the next asset with the same name, if any
+                del self.baseToPath[basename]
+                for p in self.items:
+                    if os.path.basename(p) == basename:
+                        self.baseToPath[basename] = p
+                        break
+            removed.add(path)
+
+        (item.parent() or self.treeWidget.invisibleRootItem()).removeChild(item)
+        return removed
+
+    def isModified(self, path):
+        entry = self.scanner.index.entries.get(path, None)
+        if entry is None:
+            return True
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return True
+        return entry[:2] != (stat.st_mtime_ns, stat.st_size)
+
+    def assetChanged(self, path):
+        # path was added, removed or modified on disk: caches are dropped and
+        # only the placements of its basename are redrawn
+        images.invalidate(path)
+        variants.invalidate(path)
+        self.iconsRequested.discard(path)
+
+        basename = os.path.basename(path)
+        if path in self.treeItems:
+            self.scanner.index.refresh(path)
+        else:
+            self.scanner.index.entries.pop(path, None)
+
+        current = self.baseToPath.get(basename, None)
+        if current is not None and current != path:
+            # an other asset provides the basename (or takes over after a
+            # removal), make sure it is the one being watched
+            images.invalidate(current)
+            variants.invalidate(current)
+        if current is not None and self.cellEntries.usageCount(basename):
+            self.watcher.addPath(current)
+        self.redrawAsset(basename)
+
+        if self.selectedPath == path:
+            if path in self.treeItems:
+                self.updatePreview()
+            else:
+                self.selectItem(None)
+
+    def redrawAsset(self, basename):
+        if self.cellEntries is None:
+            return
+
+        s = self.tileSize
+        path = self.baseToPath.get(basename, None)
+        for cell in self.cellEntries.placementsOf(basename):
+            x, y = cell.position
+            old = (x * s, y * s, x * s + cell.width, y * s + cell.height)
+            self.clearBox(old)
+
+            if path is not None:
+                cell = self.resizePlacement(cell, path)
+
+            box = self.cellEntries.drawCell(cell.position, self.image)
+            if box is not None:
+                old = (
+                    min(old[0], box[0]),
+                    min(old[1], box[1]),
+                    max(old[2], box[2]),
+                    max(old[3], box[3]),
+                )
+            self.updateImage(old)
+            self.imageChanged = True
+
+    def resizePlacement(self, cell, path):
+        # a placement keeps up with the new dimensions of its asset as long
+        # as its new footprint is free
+        w, h = self.scanner.index.size(path)
+        if cell.rotation == 90 or cell.rotation == 270:
+            w, h = h, w
+        if (w, h) == (cell.width, cell.height):
+            return cell
+
+        pos = cell.position
+        self.cellEntries.deleteCell(pos)
+        if self.cellEntries.checkOverlaps(pos, w, h):
+            print(f"{path} no longer fits at {pos}, keeping its old size")
+            w, h = cell.width, cell.height
+        return self.cellEntries.place(
+            pos, path, w, h, cell.rotation, cell.flipH, cell.flipV
+        )
+
+    unusedIndex = None
+
+    def indexUnused(self):
+        if self.unusedIndex is not None:
+            self.unusedIndex.detach()
+            self.unusedIndex = None
+        if self.cellEntries is not None:
+            self.unusedIndex = unusedAssets(self.items, self.cellEntries)
+
+    selectedPath = None
+
+    def treeSelectionChanged(self, *args):
+        # empty when the selected row was removed, e.g. by the watcher
+        items = self.treeWidget.selectedItems()
+        self.selectItem(items[0].oriPath if items else None)
+
+    def selectItem(self, path):
+        self.selectedPath = path
+        self.rotation = 0
+        self.flipH = False
+        self.flipV = False
+        if path is not None:
+            # R/E/W cycle through the orientations of the selected asset
+            variants.precompute(path)
+        self.updatePreview()
+        self.updateSelectionHighlight(reset=True)
+
+    highlightedAsset = None
+
+    def updateSelectionHighlight(self, *args, reset=False):
+        # highlights are painted over the canvas in paintCanvas, only the
+        # rectangles of the old and new highlight are repainted
+        previous = self.highlightRects()
+
+        self.highlightedAsset = None
+        if not reset and self.selectedPath is not None:
+            self.highlightedAsset = os.path.basename(self.selectedPath)
+
+        for rect in previous + self.highlightRects():
+            self.canvas.update(rect)
+
+    def highlightRects(self):
+        if self.highlightedAsset is None or self.cellEntries is None:
+            return []
+
+        s = self.cellEntries.tileSize * self.scale
+        return [
+            QtCore.QRect(
+                cell.position[0] * s,
+                cell.position[1] * s,
+                cell.nCols * s,
+                cell.nRows * s,
+            )
+            for cell in self.cellEntries.placementsOf(self.highlightedAsset)
+        ]
+
+    def addTile(self, row, col):
+        if self.selectedPath is None:
+            return
+
+        # the indexed dimensions, the asset is only decoded to draw it
+        size = self.scanner.index.size(self.selectedPath)
+        w, h = size
+        if self.rotation == 90 or self.rotation == 270:
+            w, h = h, w
+        if self.cellEntries.checkOverlaps((row, col), w, h):
+            return
+        # print(f"Adding {self.selectedPath} to tile {row},{col}")
+
+        # img, _ = applyTransform(img, self.rotation, self.flipH, self.flipV)
+        # self.image.paste(img, (row * self.tileSize, col * self.tileSize))
+        # self.updateImage()
+        parent = self.cellEntries.add(
+            (row, col),
+            self.selectedPath,
+            rotation=self.rotation,
+            flipH=self.flipH,
+            flipV=self.flipV,
+            size=size,
+        )
+        self.history.record(parent, True)
+
+        box = self.cellEntries.drawCell((row, col), self.image)
+        self.updateImage(box)
+
+    def removeTile(self, row, col):
+        if not self.cellEntries.hasCell((row, col)):
+            return
+        print(f"Removing tile {row},{col}")
+        parent, relatedEntries = self.cellEntries.deleteCell((row, col))
+        if parent is None:
+            print(f"No parent found for tile {row},{col}. Somehow?")
+        else:
+            self.history.record(parent, False)
+            self.redrawPlacement(parent, False)
+
+    def redrawPlacement(self, cell, placed):
+        # only the pixels of the placement are drawn or cleared
+        s = self.tileSize
+        x, y = cell.position
+        box = (x * s, y * s, x * s + cell.width, y * s + cell.height)
+        if placed:
+            box = self.cellEntries.drawCell(cell.position, self.image) or box
+        else:
+            self.clearBox(box)
+        self.updateImage(box)
+
+    def undo(self):
+        step = self.history.undo(self.cellEntries)
+        if step is not None:
+            self.redrawPlacement(*step)
+
+    def redo(self):
+        step = self.history.redo(self.cellEntries)
+        if step is not None:
+            self.redrawPlacement(*step)
+
+    def clearBox(self, box):
+        self.image.paste((0, 0, 0, 0), box)
+
+    rotation = 0
+    flipH = False
+    flipV = False
+
+    previewSize = 64
+
+    def updatePreview(self):
+        label = ""
+        if self.selectedPath is None:
+            pix = QtGui.QPixmap()
+        else:
+            size = self.previewSize
+            imPath = self.selectedPath
+            im = openVariant(imPath, self.rotation, self.flipH, self.flipV)
+            s = transformLabel(self.rotation, self.flipH, self.flipV)
+
+            w, h = im.size
+            label += f"{w}x{h}  "
+            label += s
+            if w > h:
+                im = im.resize((size, int(size * h / w)), Image.NEAREST)
+            else:
+                im = im.resize((int(size * w / h), size), Image.NEAREST)
+
+            pix = pil2pixmap(im)
+
+        self.previewLabel.setPixmap(pix)
+        self.previewText.setText(label)
+
+    def save(self):
+        if self.pendingRender:
+            self.waitForScan()
+        # a compaction still writing the sheet finishes first
+        self.journal.close()
+        # an unchanged sheet is not written again
+        sheetChanged = self.cellEntries.unsaved() or not os.path.exists(
+            self.cellEntriesPath
+        )
+        if sheetChanged:
+            self.cellEntries.save(self.cellEntriesPath)
+        if sheetChanged or self.imageChanged:
+            saveSheetImage(self.image, self.imageSavePath, self.compression)
+            self.imageChanged = False
+        self.journal.discard()
+
+    def loadCellEntries(self, path):
+        if os.path.exists(path):
+            self.cellEntries = loadSheet(path)
+        else:
+            self.cellEntries = cellEntries(16, 50, 50)
+
+        # edits since the sheet was last saved, e.g. before a crash, are
+        # replayed from its journal, new ones are appended to it
+        self.journal = sheetJournal(path, self.cellEntries)
+        self.history = editHistory()
+
+        self.cellEntries.content = self
+        self.cellEntries.usageListeners.append(self.usageChanged)
+
+
+class MainWindow(QtWidgets.QMainWindow):
+    def __init__(self):
+        super().__init__()
+
+        self.content = Content()
+        self.resize(1150, 950)
+        self.setCentralWidget(self.content)
+
+        self.rotateShortcut = QShortcut(QKeySequence("R"), self)
+        self.rotateShortcut.activated.connect(self.changeRotation)
+
+        self.flipVShortcut = QShortcut(QKeySequence("W"), self)
+        self.flipVShortcut.activated.connect(self.changeFlipV)
+
+        self.flipHShortcut = QShortcut(QKeySequence("E"), self)
+        self.flipHShortcut.activated.connect(self.changeFlipH)
+
+        self.nextUnusedShortcut = QShortcut(QKeySequence("tab"), self)
+        self.nextUnusedShortcut.activated.connect(self.nextUnused)
+
+        self.scale1Shortcut = QShortcut(QKeySequence("1"), self)
+        self.scale1Shortcut.activated.connect(self.setScale1)
+
+        self.scale2Shortcut = QShortcut(QKeySequence("2"), self)
+        self.scale2Shortcut.activated.connect(self.setScale2)
+
+        self.scale3Shortcut = QShortcut(QKeySequence("3"), self)
+        self.scale3Shortcut.activated.connect(self.setScale3)
+
+        self.scale4Shortcut = QShortcut(QKeySequence("4"), self)
+        self.scale4Shortcut.activated.connect(self.setScale4)
+
+        self.scale5Shortcut = QShortcut(QKeySequence("5"), self)
+        self.scale5Shortcut.activated.connect(self.setScale5)
+
+        self.undoShortcut = QShortcut(QKeySequence.Undo, self)
+        self.undoShortcut.activated.connect(self.content.undo)
+
+        self.redoShortcut = QShortcut(QKeySequence("Ctrl+Y"), self)
+        self.redoShortcut.activated.connect(self.content.redo)
+        self.redoShiftShortcut = QShortcut(QKeySequence("Ctrl+Shift+Z"), self)
+        self.redoShiftShortcut.activated.connect(self.content.redo)
+
+    def setScale1(self):
+        self.content.scaleChanged(1)
+
+    def setScale2(self):
+        self.content.scaleChanged(2)
+
+    def setScale3(self):
+        self.content.scaleChanged(3)
+
+    def setScale4(self):
+        self.content.scaleChanged(4)
+
+    def setScale5(self):
+        self.content.scaleChanged(5)
+
+    def changeRotation(self):
+        self.content.rotation = (self.content.rotation + 90) % 360
+        self.content.updatePreview()
+
+    def changeFlipV(self):
+        self.content.flipV = not self.content.flipV
+        self.content.updatePreview()
+
+    def changeFlipH(self):
+        self.content.flipH = not self.content.flipH
+        self.content.updatePreview()
+
+    def nextUnused(self):
+        index = self.content.unusedIndex
+        if index is None:
+            return self.content.selectItem(None)
+
+        return self.content.selectItem(index.next(self.content.selectedPath))
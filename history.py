@@ -0,0 +1,65 @@
+import os
+from collections import deque
+
+# Number of steps that can be undone, the oldest ones are forgotten beyond
+# it. Can be overridden with TSM_UNDO_STEPS.
+undoSteps = int(os.environ.get("TSM_UNDO_STEPS", 10000))
+
+
+class editHistory:
+    # Undo and redo stacks of placement edits. A step is the placement that
+    # was added or removed and which of the two, never any pixels: placements
+    # are not modified once created, so keeping the cellEntry is enough to
+    # revert either, and a step costs the same on any sheet.
+
+    def __init__(self, limit=None):
+        self.limit = limit or undoSteps
+        self.undoSteps = deque(maxlen=self.limit)
+        self.redoSteps = deque(maxlen=self.limit)
+
+    def record(self, cell, placed):
+        # a new edit, anything undone before can no longer be redone
+        self.undoSteps.append((cell, placed))
+        self.redoSteps.clear()
+
+    def undo(self, entries):
+        # reverts the last step on entries. Returns the (cell, placed) that
+        # was applied to do so, or None if there was nothing to undo.
+        return self.step(entries, self.undoSteps, self.redoSteps)
+
+    def redo(self, entries):
+        return self.step(entries, self.redoSteps, self.undoSteps)
+
+    def step(self, entries, source, target):
+        if not source:
+            return None
+        cell, placed = source.pop()
+        done = self.apply(entries, cell, not placed)
+        if done is None:
+            print(f"Could not revert {cell.imagePath} at {cell.position}")
+            return None
+        # stacks hold the edit that was made, undoing it is its inverse
+        target.append((done, not placed))
+        return done, not placed
+
+    def apply(self, entries, cell, placed):
+        # places cell again or removes the placement at its position, returns
+        # the placement that was added or removed
+        if not placed:
+            parent, _ = entries.deleteCell(cell.position)
+            return parent
+        if entries.checkOverlaps(cell.position, cell.width, cell.height):
+            return None
+        return entries.place(
+            cell.position,
+            cell.imagePath,
+            cell.width,
+            cell.height,
+            cell.rotation,
+            cell.flipH,
+            cell.flipV,
+        )
+
+    def clear(self):
+        self.undoSteps.clear()
+        self.redoSteps.clear()
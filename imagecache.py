@@ -0,0 +1,228 @@
+import os, threading
+from collections import OrderedDict
+from PIL import Image, ImageOps
+
+# Budgets of the process-wide caches of decoded assets and of their rotated
+# and flipped variants, in bytes. Can be overridden with TSM_IMAGE_CACHE_MB
+# and TSM_VARIANT_CACHE_MB.
+defaultBudget = int(os.environ.get("TSM_IMAGE_CACHE_MB", 256)) * 1024 * 1024
+defaultVariantBudget = int(os.environ.get("TSM_VARIANT_CACHE_MB", 256)) * 1024 * 1024
+
+# the 8 elements of the dihedral group as (rotation, flipH, flipV), see
+# canonicalOrientation
+orientations = [(r, h, False) for r in (0, 90, 180, 270) for h in (False, True)]
+
+
+def imageBytes(image):
+    return image.width * image.height * len(image.getbands())
+
+
+class lruCache:
+    # thread-safe, renderSheet fills the caches from a worker pool
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        self.lock = threading.RLock()
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, nBytes):
+        with self.lock:
+            self.pop(key)
+            if nBytes > self.budget:
+                # would evict everything else and still not fit
+                return value
+
+            self.entries[key] = (value, nBytes)
+            self.size += nBytes
+            self.evict()
+            return value
+
+    def pop(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return None
+            self.size -= entry[1]
+            return entry[0]
+
+    def evict(self):
+        with self.lock:
+            while self.size > self.budget and self.entries:
+                _, (_, nBytes) = self.entries.popitem(last=False)
+                self.size -= nBytes
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "budget": self.budget,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / total if total else 0.0,
+        }
+
+
+class imageCache(lruCache):
+    # Decoded source images keyed by (path, mtime). Images handed out are
+    # shared between all callers and must not be modified in place.
+
+    def __init__(self, budget=defaultBudget):
+        super().__init__(budget)
+        self.keys = {}
+
+    def key(self, path):
+        path = os.path.abspath(path)
+        return path, os.stat(path).st_mtime_ns
+
+    def open(self, path):
+        return self.lookup(path)[1]
+
+    def lookup(self, path):
+        key = self.key(path)
+        image = self.get(key)
+        if image is not None:
+            return key, image
+
+        # a different mtime means the file changed on disk, drop the old one
+        old = self.keys.get(key[0], None)
+        if old is not None and old != key:
+            self.pop(old)
+
+        image = Image.open(key[0])
+        image.load()
+        self.keys[key[0]] = key
+        return key, self.put(key, image, imageBytes(image))
+
+    def invalidate(self, path):
+        key = self.keys.pop(os.path.abspath(path), None)
+        if key is not None:
+            self.pop(key)
+
+    def clear(self):
+        super().clear()
+        self.keys.clear()
+
+
+def transform(image, rotation=0, flipH=False, flipV=False):
+    # rotations are counter-clockwise and expand, so a 90/270 rotation swaps
+    # width and height the same way cellEntries.add does for the footprint
+    if rotation:
+        image = image.rotate(rotation, expand=True)
+    if flipH:
+        image = ImageOps.mirror(image)
+    if flipV:
+        image = ImageOps.flip(image)
+    return image
+
+
+def canonicalOrientation(rotation=0, flipH=False, flipV=False):
+    # a vertical flip is a horizontal flip followed by a 180° rotation, so
+    # every (rotation, flipH, flipV) maps onto one of the 8 orientations
+    rotation = (rotation or 0) % 360
+    flipH, flipV = bool(flipH), bool(flipV)
+    if flipV:
+        rotation, flipH = (rotation + 180) % 360, not flipH
+    return rotation, flipH, False
+
+
+class variantCache(lruCache):
+    # Rotated/flipped versions of the assets in an imageCache, keyed by
+    # (path, mtime, rotation, flipH, flipV) after canonicalOrientation.
+
+    transposes = {
+        90: Image.ROTATE_90,
+        180: Image.ROTATE_180,
+        270: Image.ROTATE_270,
+    }
+
+    def __init__(self, source, budget=defaultVariantBudget):
+        super().__init__(budget)
+        self.source = source
+        self.keys = {}
+
+    def base(self, path):
+        key, image = self.source.lookup(path)
+        old = self.keys.get(key[0], None)
+        if old is not None and old != key:
+            self.invalidate(key[0])
+        self.keys[key[0]] = key
+        return key, image
+
+    def variant(self, path, rotation=0, flipH=False, flipV=False):
+        key, base = self.base(path)
+        orientation = canonicalOrientation(rotation, flipH, flipV)
+        if orientation == orientations[0]:
+            return base
+
+        image = self.get(key + orientation)
+        if image is None:
+            image = transform(base, *orientation)
+            self.put(key + orientation, image, imageBytes(image))
+        return image
+
+    def precompute(self, path):
+        # builds all 8 orientations in one pass: 4 transposes plus a mirror
+        # of each
+        key, base = self.base(path)
+        for rotation in (0, 90, 180, 270):
+            rotated = base
+            if rotation:
+                rotated = self.get(key + (rotation, False, False))
+                if rotated is None:
+                    rotated = base.transpose(self.transposes[rotation])
+                    self.put(
+                        key + (rotation, False, False), rotated, imageBytes(rotated)
+                    )
+
+            if key + (rotation, True, False) not in self:
+                mirrored = rotated.transpose(Image.FLIP_LEFT_RIGHT)
+                self.put(key + (rotation, True, False), mirrored, imageBytes(mirrored))
+
+    def invalidate(self, path):
+        path = os.path.abspath(path)
+        with self.lock:
+            self.keys.pop(path, None)
+            for key in [k for k in self.entries if k[0] == path]:
+                self.pop(key)
+
+    def clear(self):
+        super().clear()
+        self.keys.clear()
+
+
+images = imageCache()
+variants = variantCache(images)
+
+
+def openImage(path):
+    return images.open(path)
+
+
+def openVariant(path, rotation=0, flipH=False, flipV=False):
+    return variants.variant(path, rotation, flipH, flipV)
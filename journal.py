@@ -0,0 +1,238 @@
+import os, struct, threading, zlib
+from concurrent.futures import ThreadPoolExecutor
+from sheet import flagFlipH, flagFlipV, newJournalToken, saveSheet, sheetSnapshot
+
+# Edits made to a sheet since it was saved, appended to <sheet>.journal as
+# they happen so a crash loses at most the edit being written:
+#
+#   magic          8 bytes  b"TSMJRNL\0"
+#   base           32 bytes ascii, the journalToken of the saved sheet the
+#                  records apply to (empty for none)
+#   records        crc32 and length of the body (uint32, uint16), then the
+#                  body: op, x, y, width, height, rotation, flags
+#                  (uint8, 4 * int32, uint16, uint8) and a utf-8 name
+#
+# A place record names the asset, a delete record only needs the position
+# of the placement. A checkpoint record names the journalToken of a
+# snapshot of the sheet up to that point, see sheetJournal.compact. All
+# integers are little endian.
+journalMagic = b"TSMJRNL\0"
+journalPrefix = struct.Struct("<8s32s")
+recordPrefix = struct.Struct("<IH")
+recordBody = struct.Struct("<BiiiiHB")
+
+opPlace = 1
+opDelete = 2
+opCheckpoint = 3
+
+# records after which the journal is compacted into the sheet
+compactEvery = 1000
+
+
+def journalPath(sheetPath):
+    return f"{sheetPath}.journal"
+
+
+def packRecord(op, x=0, y=0, width=0, height=0, rotation=0, flags=0, name=""):
+    body = recordBody.pack(op, x, y, width, height, rotation, flags)
+    body += name.encode("utf-8")
+    return recordPrefix.pack(zlib.crc32(body), len(body)) + body
+
+
+def readJournal(path):
+    # (base, [(op, x, y, width, height, rotation, flags, name, end)], end)
+    # of a journal, where end is the offset after a record and after the last
+    # intact one respectively. A record cut short by a crash and everything
+    # after it is ignored. None if there is no readable journal.
+    try:
+        with open(path, "rb") as fil:
+            data = fil.read()
+    except OSError:
+        return None
+    if len(data) < journalPrefix.size:
+        return None
+    magic, base = journalPrefix.unpack_from(data)
+    if magic != journalMagic:
+        return None
+
+    records, offset = [], journalPrefix.size
+    while offset + recordPrefix.size <= len(data):
+        crc, length = recordPrefix.unpack_from(data, offset)
+        start, end = offset + recordPrefix.size, offset + recordPrefix.size + length
+        body = data[start:end]
+        if length < recordBody.size or len(body) < length or zlib.crc32(body) != crc:
+            break
+        fields = recordBody.unpack_from(body)
+        records.append(fields + (body[recordBody.size :].decode("utf-8"), end))
+        offset = end
+
+    return base.rstrip(b"\0").decode("ascii") or None, records, offset
+
+
+def replayJournal(entries, path):
+    # applies the records of the journal at path made after the state entries
+    # was saved in. Returns the number of edits replayed and the offset the
+    # journal can be appended to, or None if the journal does not apply.
+    journal = readJournal(path)
+    if journal is None:
+        return None
+    base, records, end = journal
+
+    # the records after the last checkpoint matching the sheet
+    start = 0 if base == entries.journalToken else None
+    for i, (op, *_, name, _) in enumerate(records):
+        if op == opCheckpoint and name == entries.journalToken:
+            start = i + 1
+    if start is None:
+        return None
+
+    replayed = 0
+    for op, x, y, width, height, rotation, flags, name, _ in records[start:]:
+        if op == opPlace:
+            entries.place(
+                (x, y),
+                name,
+                width,
+                height,
+                rotation,
+                bool(flags & flagFlipH),
+                bool(flags & flagFlipV),
+            )
+        elif op == opDelete:
+            entries.deleteCell((x, y))
+        else:
+            continue
+        replayed += 1
+    return replayed, end
+
+
+class sheetJournal:
+    # Appends every edit of a cellEntries to the journal of the sheet at
+    # sheetPath, one small write per edit. Every compactEvery edits the
+    # sheet is written from a snapshot on a background thread, after which
+    # the journal is cut down to the edits made since.
+    #
+    # Edits already in the journal are replayed into entries first, so it
+    # is attached right after loading the sheet.
+
+    def __init__(self, sheetPath, entries):
+        self.sheetPath = sheetPath
+        self.path = journalPath(sheetPath)
+        self.entries = entries
+        self.lock = threading.RLock()
+        self.pool = None
+        self.compaction = None
+        self.fil = None
+        self.records = 0
+
+        replay = replayJournal(entries, self.path)
+        if replay is None:
+            self.replayed = 0
+        else:
+            self.replayed, end = replay
+            # drops a record cut short by a crash, new records go after the
+            # last intact one
+            self.fil = open(self.path, "r+b", buffering=0)
+            self.fil.truncate(end)
+            self.fil.seek(end)
+            if self.replayed:
+                print(f"Recovered {self.replayed} edits from {self.path}")
+                self.compact()
+
+        entries.editListeners.append(self.edited)
+
+    def edited(self, cell, placed):
+        if placed:
+            flags = (flagFlipH if cell.flipH else 0) | (flagFlipV if cell.flipV else 0)
+            record = packRecord(
+                opPlace,
+                cell.position[0],
+                cell.position[1],
+                cell.width,
+                cell.height,
+                cell.rotation or 0,
+                flags,
+                cell.imagePath,
+            )
+        else:
+            record = packRecord(opDelete, cell.position[0], cell.position[1])
+        self.append(record)
+
+        self.records += 1
+        if self.records >= compactEvery:
+            self.compact()
+
+    def append(self, record):
+        with self.lock:
+            if self.fil is None:
+                self.start(self.entries.journalToken)
+            # unbuffered, the record reaches the file in a single write
+            self.fil.write(record)
+
+    def start(self, base, records=b""):
+        # (re)writes the journal with a new base and the given records
+        if self.fil is not None:
+            self.fil.close()
+        tmpPath = f"{self.path}.tmp"
+        with open(tmpPath, "wb") as fil:
+            fil.write(journalPrefix.pack(journalMagic, (base or "").encode("ascii")))
+            fil.write(records)
+        os.replace(tmpPath, self.path)
+        self.fil = open(self.path, "ab", buffering=0)
+
+    def compact(self):
+        # One compaction at a time. The snapshot and a checkpoint record
+        # naming it are taken here, together, so the sheet written in the
+        # background is exactly the journal up to the checkpoint.
+        if self.compaction is not None and not self.compaction.done():
+            return
+        self.records = 0
+        token = newJournalToken()
+        snapshot = sheetSnapshot(self.entries, token)
+        with self.lock:
+            self.append(packRecord(opCheckpoint, name=token))
+            offset = self.fil.tell()
+
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(1)
+        self.compaction = self.pool.submit(self.writeSnapshot, snapshot, offset)
+
+    def writeSnapshot(self, snapshot, offset):
+        try:
+            saveSheet(snapshot, self.sheetPath)
+        except OSError as e:
+            print(f"Could not compact {self.path}: {e}")
+            return
+
+        # the edits up to the checkpoint are in the sheet now, only the ones
+        # made while it was written are kept. Until the journal is replaced
+        # the checkpoint matches the sheet, after it the base does.
+        with self.lock:
+            with open(self.path, "rb") as fil:
+                fil.seek(offset)
+                tail = fil.read()
+            self.start(snapshot.journalToken, tail)
+
+    def wait(self):
+        if self.compaction is not None:
+            self.compaction.result()
+
+    def close(self):
+        self.wait()
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        with self.lock:
+            if self.fil is not None:
+                self.fil.close()
+                self.fil = None
+
+    def discard(self):
+        # once the sheet is saved with every edit the journal is not needed
+        self.close()
+        if self.edited in self.entries.editListeners:
+            self.entries.editListeners.remove(self.edited)
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
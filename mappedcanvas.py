@@ -0,0 +1,144 @@
+import os, mmap, tempfile
+import numpy as np
+from PIL import Image
+from pngstream import writePng
+
+# Sheets of more than mappedPixels pixels are rendered into a mappedCanvas
+# instead of an in-memory image, see newSheetImage. Can be overridden (in
+# megapixels) with TSM_MAPPED_MPX.
+mappedPixels = int(os.environ.get("TSM_MAPPED_MPX", 64)) * 1024 * 1024
+
+
+class mappedCanvas:
+    # RGBA pixels in a memory-mapped temporary file, laid out as square tiles
+    # so pasting an asset touches a few contiguous pages instead of one page
+    # per row. Supports the part of the PIL Image interface the sheet code
+    # uses (size, paste, crop, save). Written pages are handed back to the
+    # kernel with release(), which keeps the resident memory bounded however
+    # big the sheet is.
+
+    tileSize = 256
+    # pasted bytes after which release() is called by paste
+    releaseEvery = 64 * 1024 * 1024
+
+    def __init__(self, size, directory=None):
+        self.width, self.height = self.size = size
+        t = self.tileSize
+        self.tilesX = -(-self.width // t)
+        self.tilesY = -(-self.height // t)
+
+        # a sparse file, unwritten tiles read back as transparent
+        self.file = tempfile.TemporaryFile(dir=directory)
+        self.dirty = 0
+        self.tiles = np.memmap(
+            self.file,
+            dtype=np.uint8,
+            mode="w+",
+            shape=(self.tilesY, self.tilesX, t, t, 4),
+        )
+
+    def spans(self, x1, y1, x2, y2):
+        # yields (tx, ty, x1, y1, x2, y2), the part of the box on every tile
+        # under it, in canvas pixels
+        t = self.tileSize
+        for ty in range(y1 // t, (y2 - 1) // t + 1):
+            for tx in range(x1 // t, (x2 - 1) // t + 1):
+                yield (
+                    tx,
+                    ty,
+                    max(x1, tx * t),
+                    max(y1, ty * t),
+                    min(x2, (tx + 1) * t),
+                    min(y2, (ty + 1) * t),
+                )
+
+    def clip(self, box):
+        x1, y1 = max(box[0], 0), max(box[1], 0)
+        x2, y2 = min(box[2], self.width), min(box[3], self.height)
+        if x1 >= x2 or y1 >= y2:
+            return None
+        return x1, y1, x2, y2
+
+    def paste(self, im, box):
+        # like Image.paste without a mask: im is an image placed with its top
+        # left corner at box (x, y), or an RGBA color filling box
+        # (x1, y1, x2, y2)
+        if isinstance(im, Image.Image):
+            if im.mode != "RGBA":
+                im = im.convert("RGBA")
+            pixels = np.asarray(im)
+            x, y = box[:2]
+            target = self.clip((x, y, x + im.width, y + im.height))
+        else:
+            pixels = np.array(im, dtype=np.uint8)
+            x, y = box[:2]
+            target = self.clip(box)
+        if target is None:
+            return
+
+        t = self.tileSize
+        for tx, ty, x1, y1, x2, y2 in self.spans(*target):
+            if pixels.ndim == 3:
+                source = pixels[y1 - y : y2 - y, x1 - x : x2 - x]
+            else:
+                source = pixels
+            ox, oy = tx * t, ty * t
+            self.tiles[ty, tx, y1 - oy : y2 - oy, x1 - ox : x2 - ox] = source
+
+        x1, y1, x2, y2 = target
+        self.dirty += (x2 - x1) * (y2 - y1) * 4
+        if self.dirty > self.releaseEvery:
+            self.release()
+
+    def region(self, box):
+        # the pixels under box as a (height, width, 4) array, transparent
+        # outside of the canvas
+        bx, by = box[:2]
+        out = np.zeros((box[3] - by, box[2] - bx, 4), dtype=np.uint8)
+        box = self.clip(box)
+        if box is None:
+            return out
+
+        t = self.tileSize
+        for tx, ty, x1, y1, x2, y2 in self.spans(*box):
+            ox, oy = tx * t, ty * t
+            out[y1 - by : y2 - by, x1 - bx : x2 - bx] = self.tiles[
+                ty, tx, y1 - oy : y2 - oy, x1 - ox : x2 - ox
+            ]
+        return out
+
+    def crop(self, box):
+        return Image.fromarray(self.region(box), "RGBA")
+
+    def bands(self):
+        # one row of tiles at a time, as (rows, width, 4) arrays
+        t = self.tileSize
+        self.release()
+        for ty in range(self.tilesY):
+            rows = min(t, self.height - ty * t)
+            band = self.tiles[ty, :, :rows].transpose(1, 0, 2, 3)
+            yield band.reshape(rows, self.tilesX * t, 4)[:, : self.width]
+            # a tile row is one contiguous block of the file
+            size = self.tiles[ty].nbytes
+            self.drop(ty * size, size)
+
+    def release(self):
+        # writes dirty pages back to the file and drops them from memory,
+        # they are read back in from the file when touched again
+        if self.dirty:
+            self.tiles.flush()
+            self.dirty = 0
+        self.drop(0, self.tiles.nbytes)
+
+    def drop(self, start, length):
+        # only clean pages may be dropped
+        mapping = getattr(self.tiles, "_mmap", None)
+        if mapping is not None and hasattr(mmap, "MADV_DONTNEED"):
+            mapping.madvise(mmap.MADV_DONTNEED, start, length)
+
+    def save(self, path, level=6, workers=None):
+        writePng(path, self.width, self.height, self.bands(), level, workers)
+
+    def close(self):
+        del self.tiles
+        self.file.close()
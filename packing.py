@@ -0,0 +1,128 @@
+import os, sys, math, time
+import numpy as np
+from sheet import cellEntries, placementDtype
+
+# Everything in here works on the tile grid: asset sizes are given in cells
+# (width and height in pixels rounded up to whole tiles) and positions are
+# (column, row) pairs, like cellEntry.position.
+
+# fraction of the sheet the default width is chosen for, see sheetWidth
+targetFill = 0.9
+
+
+def cellSize(width, height, tileSize):
+    return -(-width // tileSize), -(-height // tileSize)
+
+
+def sheetWidth(sizes, rotate=False):
+    # columns of a roughly square sheet for sizes, wide enough for the
+    # widest (or with rotate, the longest narrow side of an) asset
+    area = sum(w * h for w, h in sizes)
+    widest = max(min(w, h) if rotate else w for w, h in sizes)
+    return max(widest, math.ceil(math.sqrt(area / targetFill)))
+
+
+def skylinePack(sizes, width, rotate=False):
+    # Bottom-left skyline packing of sizes [(w, h), ...] into a strip of
+    # width columns. The skyline is the height of every column, each asset
+    # (tallest first) goes where its bottom edge ends up lowest, leftmost on
+    # ties. With rotate an asset may also be placed turned by 90°.
+    #
+    # Returns [(x, y, rotated), ...] in the order of sizes and the number of
+    # rows used.
+    sizes = [(int(w), int(h)) for w, h in sizes]
+    if rotate:
+        # tallest and widest first, each asset considered upright
+        order = sorted(
+            range(len(sizes)),
+            key=lambda i: (-max(sizes[i]), -min(sizes[i]), i),
+        )
+    else:
+        order = sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], -sizes[i][0], i))
+
+    skyline = np.zeros(width, dtype=np.int64)
+    result = [None] * len(sizes)
+
+    for i in order:
+        w, h = sizes[i]
+        options = [(w, h, False)]
+        if rotate and w != h:
+            options.append((h, w, True))
+
+        best = None
+        for ow, oh, rotated in options:
+            if ow > width:
+                continue
+            # top of the skyline under every possible span of ow columns,
+            # assets are narrow so this is a handful of vector maxima
+            tops = skyline[: width - ow + 1]
+            if ow > 1:
+                tops = tops.copy()
+                for k in range(1, ow):
+                    np.maximum(tops, skyline[k : width - ow + 1 + k], out=tops)
+            x = int(np.argmin(tops))
+            y = int(tops[x])
+            if best is None or (y + oh, y, x) < best[0]:
+                best = (y + oh, y, x), ow, oh, rotated
+
+        if best is None:
+            raise ValueError(
+                f"Asset {i} ({w}x{h} cells) does not fit in {width} columns"
+            )
+        (bottom, y, x), ow, oh, rotated = best
+        skyline[x : x + ow] = bottom
+        result[i] = (x, y, rotated)
+
+    return result, int(skyline.max(initial=0))
+
+
+def packSheet(assets, sizes, tileSize, width=None, rotate=False):
+    # a cellEntries with every asset (by basename) placed on it. sizes are
+    # the (width, height) of the assets in pixels.
+    cells = [cellSize(w, h, tileSize) for w, h in sizes]
+    if width is None:
+        width = sheetWidth(cells, rotate) if cells else 1
+    positions, height = skylinePack(cells, width, rotate)
+
+    placements = np.zeros(len(assets), dtype=placementDtype)
+    for i, ((x, y, rotated), (w, h)) in enumerate(zip(positions, sizes)):
+        # a 90° rotation swaps the footprint, see cellEntries.add
+        if rotated:
+            w, h = h, w
+        placements[i] = (x, y, w, h, i, 90 if rotated else 0, 0)
+
+    entries = cellEntries(tileSize, max(height, 1), width)
+    entries.placeAll(placements, [os.path.basename(p) for p in assets])
+    return entries
+
+
+def fillRatio(entries):
+    # share of the sheet's cells covered by a placement
+    return float(np.count_nonzero(entries.grid)) / entries.grid.size
+
+
+def benchmark(count=10000, rotate=False, seed=0):
+    # packs count synthetic assets, mostly single tiles with some larger
+    # props, and reports the fill ratio and runtime
+    rng = np.random.default_rng(seed)
+    shapes = [(1, 1), (1, 2), (2, 1), (2, 2), (3, 2), (2, 3), (4, 4), (1, 4)]
+    weights = [0.6, 0.08, 0.08, 0.1, 0.04, 0.04, 0.02, 0.04]
+    sizes = [shapes[i] for i in rng.choice(len(shapes), size=count, p=weights)]
+
+    start = time.perf_counter()
+    positions, height = skylinePack(sizes, sheetWidth(sizes, rotate), rotate)
+    elapsed = time.perf_counter() - start
+
+    width = sheetWidth(sizes, rotate)
+    fill = sum(w * h for w, h in sizes) / (width * height)
+    print(
+        f"{count} assets{' (rotate)' if rotate else ''}: {width}x{height} cells, "
+        f"fill {fill:.1%}, {elapsed * 1000:.0f} ms"
+    )
+    return fill, elapsed
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    benchmark(count)
+    benchmark(count, rotate=True)
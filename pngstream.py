@@ -0,0 +1,160 @@
+import os, struct, zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# PNG writer that takes the image as a sequence of bands of rows, so images
+# larger than memory (see mappedcanvas) can be encoded with a few bands in
+# memory at a time. Bands are filtered and deflated in parallel, each one as
+# a strip of the zlib stream. Only 8 bit RGBA is written.
+
+pngSignature = b"\x89PNG\r\n\x1a\n"
+
+# zlib level of each compression profile
+compressionLevels = {"fast": 1, "default": 6, "max": 9}
+
+# deflate's window, the data before a strip it may refer back to
+windowSize = 32768
+
+
+def writeChunk(fil, kind, data):
+    fil.write(struct.pack(">I", len(data)))
+    fil.write(kind)
+    fil.write(data)
+    fil.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind))))
+
+
+# every sampleStep-th pixel of a row is used to pick its filter
+sampleStep = 8
+
+
+def predict(kind, left, up, upLeft):
+    # the PNG filter predictors on uint8 arrays, (left + up) // 2 and the
+    # Paeth distances need a wider type
+    if kind == 0:
+        return 0
+    if kind == 1:
+        return left
+    if kind == 2:
+        return up
+    if kind == 3:
+        return ((left.astype(np.uint16) + up) >> 1).astype(np.uint8)
+
+    a, b, c = left.astype(np.int16), up.astype(np.int16), upLeft.astype(np.int16)
+    pa, pb, pc = np.abs(b - c), np.abs(a - c), np.abs(a + b - 2 * c)
+    return np.where((pa <= pb) & (pa <= pc), left, np.where(pb <= pc, up, upLeft))
+
+
+def filterBand(band, previous):
+    # Filters a (rows, width, 4) uint8 band, previous being the last row of
+    # the band before (or None for the first band). Every row gets the PNG
+    # filter (None, Sub, Up, Average or Paeth) with the smallest sum of
+    # absolute values over a sample of its pixels, close to libpng's
+    # heuristic. Returns the filtered rows, each prefixed with its filter
+    # type, as bytes.
+    rows, width = band.shape[:2]
+    band = np.ascontiguousarray(band)
+    if previous is None:
+        previous = np.zeros((width, 4), dtype=np.uint8)
+
+    # every pixel only depends on its neighbours, so a sample of them (and
+    # their left neighbours) is enough to estimate the cost of each filter.
+    # uint8 arithmetic wraps around like the filters are defined to.
+    step = sampleStep
+    above = np.concatenate((previous[None], band[:-1]))
+    raw = np.ascontiguousarray(band[:, ::step])
+    up = np.ascontiguousarray(above[:, ::step])
+    left, upLeft = np.zeros_like(raw), np.zeros_like(up)
+    left[:, 1:] = band[:, step - 1 :: step][:, : raw.shape[1] - 1]
+    upLeft[:, 1:] = above[:, step - 1 :: step][:, : raw.shape[1] - 1]
+    cost = []
+    for kind in range(5):
+        f = raw - predict(kind, left, up, upLeft)
+        # the bytes as signed values, closest to 0 compresses best
+        cost.append(np.minimum(f, -f).sum(axis=(1, 2), dtype=np.uint32))
+    choice = np.argmin(np.stack(cost), axis=0)
+
+    # rows as flat bytes, the pixel to the left is 4 bytes back
+    out = np.empty((rows, width * 4 + 1), dtype=np.uint8)
+    out[:, 0] = choice
+    flat = band.reshape(rows, width * 4)
+    flatAbove = above.reshape(rows, width * 4)
+    for row, kind in enumerate(choice.tolist()):
+        target, raw, up = out[row, 1:], flat[row], flatAbove[row]
+        if kind == 0:
+            target[:] = raw
+        elif kind == 2:
+            np.subtract(raw, up, out=target)
+        else:
+            left, upLeft = np.zeros_like(raw), np.zeros_like(up)
+            left[4:], upLeft[4:] = raw[:-4], up[:-4]
+            np.subtract(raw, predict(kind, left, up, upLeft), out=target)
+    return out.tobytes()
+
+
+def deflateStrip(filtered, before, level):
+    # raw deflate of a filtered band, primed with the end of the band before
+    # so matches across strips are not lost. The strip ends on a byte
+    # boundary without a final block, strips are simply concatenated.
+    data = filtered.result()
+    if before is None:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    else:
+        dictionary = before.result()[-windowSize:]
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=dictionary)
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+def imageBands(image, rows=256):
+    # an RGBA PIL image as bands for writePng, copied a band at a time
+    for y in range(0, image.height, rows):
+        yield np.asarray(image.crop((0, y, image.width, min(y + rows, image.height))))
+
+
+def writePng(path, width, height, bands, level=6, workers=None):
+    # bands yields (rows, width, 4) uint8 arrays, top to bottom, height rows
+    # in total. They are encoded on workers threads (all cores by default)
+    # and written in order. Written next to path and moved over it once
+    # complete.
+    workers = workers or os.cpu_count() or 1
+    tmpPath = f"{path}.tmp"
+    with open(tmpPath, "wb") as fil, ThreadPoolExecutor(workers) as pool:
+        fil.write(pngSignature)
+        writeChunk(fil, b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+
+        # the zlib stream is its 2 byte header, the strips, an empty final
+        # block and the adler32 of all filtered data
+        writeChunk(fil, b"IDAT", zlib.compress(b"", level)[:2])
+        checksum, written = 1, 0
+        strips = deque()
+        filtered = previous = None
+        for band in bands:
+            # filterBand runs before deflateStrip of the same band is
+            # picked up by a worker, so waiting on it can not deadlock
+            before = filtered
+            filtered = pool.submit(filterBand, band, previous)
+            strips.append(
+                (filtered, pool.submit(deflateStrip, filtered, before, level))
+            )
+            previous = np.array(band[-1])
+            written += band.shape[0]
+
+            while len(strips) > 2 * workers:
+                checksum = writeStrip(fil, strips.popleft(), checksum)
+        while strips:
+            checksum = writeStrip(fil, strips.popleft(), checksum)
+
+        final = zlib.compressobj(level, zlib.DEFLATED, -15).flush()
+        writeChunk(fil, b"IDAT", final + struct.pack(">I", checksum))
+        writeChunk(fil, b"IEND", b"")
+
+    if written != height:
+        os.remove(tmpPath)
+        raise ValueError(f"Expected {height} rows, got {written}")
+    os.replace(tmpPath, path)
+
+
+def writeStrip(fil, strip, checksum):
+    filtered, deflated = strip
+    writeChunk(fil, b"IDAT", deflated.result())
+    return zlib.adler32(filtered.result(), checksum)
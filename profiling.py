@@ -0,0 +1,153 @@
+import os, time, functools, importlib
+
+# Opt-in timing of the editor's hot paths, see run.main (--profile or
+# TSM_PROFILE). Nothing in here is imported or patched unless profiling is
+# enabled: the methods below are only replaced by timing wrappers then, so
+# a normal run pays nothing for it (csv and json are only imported when the
+# summary is written).
+
+# module -> [(class, method)] timed when profiling, modules that are not
+# loaded by a command are left out, see enable
+hotPaths = {
+    "sheet": [("cellEntries", "drawCell")],
+    "gui": [
+        ("Content", "loadDirectory"),
+        ("Content", "load"),
+        ("Content", "drawSheet"),
+        ("Content", "updateImage"),
+        ("Content", "updateSelectionHighlight"),
+        ("Content", "addTile"),
+        ("Content", "removeTile"),
+        ("Content", "save"),
+    ],
+}
+
+defaultPath = "tsm-profile.json"
+
+# the running profile, None when profiling is off
+current = None
+
+
+class hotPathProfile:
+    def __init__(self, command):
+        self.command = command
+        self.start = time.perf_counter()
+        # "class.method" -> [calls, total seconds, max seconds]
+        self.timings = {}
+        # name -> callable returning a cache (lruCache.stats or hits/misses)
+        self.caches = {}
+
+    def instrument(self, owner, name):
+        label = f"{owner.__name__}.{name}"
+        stats = self.timings.setdefault(label, [0, 0.0, 0.0])
+        function = getattr(owner, name)
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                stats[0] += 1
+                stats[1] += elapsed
+                if elapsed > stats[2]:
+                    stats[2] = elapsed
+
+        setattr(owner, name, timed)
+
+    def watch(self, name, cache):
+        # cache is called when the summary is made, so caches replaced in
+        # the meantime (e.g. on a rescan) are reported as they end up
+        self.caches[name] = cache
+
+    def summary(self):
+        timings = {
+            label: {
+                "calls": calls,
+                "totalSeconds": total,
+                "meanSeconds": total / calls if calls else 0.0,
+                "maxSeconds": longest,
+            }
+            for label, (calls, total, longest) in self.timings.items()
+        }
+        caches = {}
+        for name, cache in self.caches.items():
+            stats = cacheStats(cache())
+            if stats is not None:
+                caches[name] = stats
+        return {
+            "command": self.command,
+            "wallSeconds": time.perf_counter() - self.start,
+            "timings": timings,
+            "caches": caches,
+        }
+
+    def write(self, path):
+        import json
+
+        summary = self.summary()
+        with open(path, "w", newline="") as fil:
+            if path.endswith(".csv"):
+                writeCsv(fil, summary)
+            else:
+                json.dump(summary, fil, indent=2)
+        print(f"Profile written to {path}")
+
+
+def cacheStats(cache):
+    if cache is None:
+        return None
+    if hasattr(cache, "stats"):
+        return cache.stats()
+    total = cache.hits + cache.misses
+    return {
+        "hits": cache.hits,
+        "misses": cache.misses,
+        "hitRate": cache.hits / total if total else 0.0,
+    }
+
+
+def writeCsv(fil, summary):
+    import csv
+
+    columns = ["calls", "totalSeconds", "meanSeconds", "maxSeconds"]
+    columns += ["hits", "misses", "hitRate"]
+    writer = csv.writer(fil)
+    writer.writerow(["section", "name"] + columns)
+    for section in ("timings", "caches"):
+        for name, values in summary[section].items():
+            writer.writerow([section, name] + [values.get(c, "") for c in columns])
+
+
+def enable(command, modules):
+    # times the hotPaths of modules and reports the process-wide image
+    # caches, returns the profile
+    global current
+    from imagecache import images, variants
+
+    current = hotPathProfile(command)
+    for module in modules:
+        loaded = importlib.import_module(module)
+        for owner, name in hotPaths.get(module, []):
+            current.instrument(getattr(loaded, owner), name)
+    current.watch("images", lambda: images)
+    current.watch("variants", lambda: variants)
+    return current
+
+
+def watch(name, cache):
+    # see hotPathProfile.watch, does nothing when profiling is off
+    if current is not None:
+        current.watch(name, cache)
+
+
+def profilePath(flag=None):
+    # the summary path for a --profile[=<path>] flag, or TSM_PROFILE if there
+    # is none ("1" meaning the default path). None when profiling is off.
+    if flag is not None:
+        return flag.partition("=")[2] or defaultPath
+    value = os.environ.get("TSM_PROFILE", "")
+    if value in ("", "0"):
+        return None
+    return defaultPath if value == "1" else value
@@ -9,7 +9,23 @@ setup(
     version="0.1.1",
     description="Make tilesets",
     author="Groog",
-    py_modules=["table", "window", "run"],
+    py_modules=[
+        "window",
+        "run",
+        "gui",
+        "sheet",
+        "imagecache",
+        "thumbcache",
+        "assetindex",
+        "packing",
+        "dupes",
+        "pngstream",
+        "mappedcanvas",
+        "journal",
+        "history",
+        "profiling",
+        "filters",
+    ],
     # scripts=["tsm.py"],
     entry_points={"console_scripts": ["tsm=run:main"]},
 )
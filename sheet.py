@@ -0,0 +1,754 @@
+import io, os, pickle, math, json, struct
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+import numpy as np
+from imagecache import openImage, openVariant, transform
+from mappedcanvas import mappedCanvas, mappedPixels
+from pngstream import compressionLevels, imageBands, writePng
+
+# Everything in here is free of Qt so sheets can be built headless, see
+# commandBuild in run.py.
+
+
+def transformLabel(rotation=0, flipH=False, flipV=False):
+    s = []
+    if rotation:
+        s.append(f"rotation: {rotation}")
+    if flipH:
+        s.append("flipH")
+    if flipV:
+        s.append("flipV")
+    return "  ".join(s)
+
+
+def applyTransform(image, rotation=0, flipH=False, flipV=False):
+    image = transform(image, rotation, flipH, flipV)
+    return image, transformLabel(rotation, flipH, flipV)
+
+
+class cellEntry:
+    # One placement (parent is None), or a view of one of the other cells it
+    # covers (parent is the placement). Only placements are stored, views are
+    # created by cellEntries.getCell on demand.
+
+    __slots__ = (
+        "id",
+        "parent",
+        "position",
+        "imagePath",
+        "width",
+        "height",
+        "nCols",
+        "nRows",
+        "rotation",
+        "flipH",
+        "flipV",
+    )
+
+    def __init__(
+        self,
+        pos,
+        imagePath,
+        parent=None,
+        width=None,
+        height=None,
+        rotation=None,
+        flipH=None,
+        flipV=None,
+        id=0,
+        tileSize=None,
+    ):
+        self.id = id
+        self.parent = parent
+        self.position = pos
+        self.imagePath = os.path.basename(imagePath)
+        self.rotation = rotation
+        self.flipH = flipH
+        self.flipV = flipV
+        self.width = width
+        self.height = height
+        self.nCols = self.nRows = 1
+
+        if parent is not None:
+            self.id = parent.id
+        elif tileSize is not None:
+            self.nCols = math.ceil(width / tileSize)
+            self.nRows = math.ceil(height / tileSize)
+
+    def cells(self):
+        x, y = self.position
+        return [
+            (x + j, y + i)
+            for j in range(self.nCols)
+            for i in range(self.nRows)
+            if i or j
+        ] + [self.position]
+
+    def getAll(self):
+        if self.parent:
+            return self.parent.getAll()
+        else:
+            return self, self.cells()
+
+
+class cellEntries:
+    # The grid is a (nCol, nRow) array indexed by position, holding the id of
+    # the placement covering each cell (0 for free cells). Placements
+    # themselves live in self.placements by id.
+
+    def __init__(self, tileSize, nRow, nCol):
+        self.tileSize = tileSize
+        self.nRow = nRow
+        self.nCol = nCol
+        self.usedImagePaths = set()
+        self.usage = {}
+        self.usageListeners = []
+        self.byAsset = {}
+        self.grid = np.zeros((nCol, nRow), dtype=np.int32)
+        self.placements = {}
+        self.nextId = 1
+        # basename -> (basename, rotation, flipH, flipV) for assets without a
+        # placement of their own that are drawn as an oriented other asset,
+        # see dupes.findDuplicates
+        self.aliases = {}
+        # bumped by every change to the placements, savedChanges is its value
+        # when the sheet was last loaded or saved, see unsaved
+        self.changes = 0
+        self.savedChanges = 0
+        # called with (placement, placed) for every single place or delete,
+        # see journal.sheetJournal
+        self.editListeners = []
+        # written to the sheet header on every save, identifies the saved
+        # state a journal applies to
+        self.journalToken = None
+
+    def inBounds(self, pos):
+        return 0 <= pos[0] < self.nCol and 0 <= pos[1] < self.nRow
+
+    def hasCell(self, pos):
+        return self.inBounds(pos) and self.grid[pos] != 0
+
+    def footprint(self, pos, w, h):
+        nCols, nRows = math.ceil(w / self.tileSize), math.ceil(h / self.tileSize)
+        return (
+            slice(max(pos[0], 0), pos[0] + nCols),
+            slice(max(pos[1], 0), pos[1] + nRows),
+        )
+
+    def checkOverlaps(self, pos, w, h):
+        # footprints sticking out of the sheet count as overlapping
+        nCols, nRows = math.ceil(w / self.tileSize), math.ceil(h / self.tileSize)
+        if not (
+            self.inBounds(pos)
+            and pos[0] + nCols <= self.nCol
+            and pos[1] + nRows <= self.nRow
+        ):
+            return True
+        return bool(self.grid[self.footprint(pos, w, h)].any())
+
+    def getCell(self, pos):
+        if not self.hasCell(pos):
+            return None
+
+        parent = self.placements[int(self.grid[pos])]
+        if parent.position == pos:
+            return parent
+        return cellEntry(pos, parent.imagePath, parent=parent)
+
+    def deleteCell(self, pos):
+        parent, relatedEntries = None, []
+        if self.hasCell(pos):
+            parent = self.placements.pop(int(self.grid[pos]))
+            relatedEntries = parent.cells()
+            region = self.grid[
+                self.footprint(parent.position, parent.width, parent.height)
+            ]
+            region[region == parent.id] = 0
+            self.byAsset[parent.imagePath].pop(parent.id)
+            if not self.byAsset[parent.imagePath]:
+                del self.byAsset[parent.imagePath]
+            self.use(parent.imagePath, -1)
+            self.changes += 1
+            for listener in self.editListeners:
+                listener(parent, False)
+
+        return parent, relatedEntries
+
+    def add(self, pos, imagePath, rotation=None, flipH=None, flipV=None, size=None):
+        # size is the (width, height) of the asset when already known, e.g.
+        # from an assetIndex, otherwise the asset is opened for it
+        w, h = openImage(imagePath).size if size is None else size
+
+        if rotation == 90 or rotation == 270:
+            w, h = h, w
+
+        return self.place(pos, imagePath, w, h, rotation, flipH, flipV)
+
+    def place(self, pos, imagePath, w, h, rotation=None, flipH=None, flipV=None):
+        # adds a placement whose (already rotated) size is known, without
+        # touching the asset itself. Cells outside the sheet are not tracked.
+        parent = cellEntry(
+            pos,
+            imagePath,
+            width=w,
+            height=h,
+            rotation=rotation,
+            flipH=flipH,
+            flipV=flipV,
+            id=self.nextId,
+            tileSize=self.tileSize,
+        )
+        self.nextId += 1
+        self.placements[parent.id] = parent
+        self.byAsset.setdefault(parent.imagePath, {})[parent.id] = parent
+        self.grid[self.footprint(pos, w, h)] = parent.id
+        self.use(parent.imagePath, 1)
+        self.changes += 1
+        for listener in self.editListeners:
+            listener(parent, True)
+
+        return parent
+
+    def placeAll(self, placements, assets):
+        # bulk place() for a placementDtype array whose asset column indexes
+        # into assets, used when loading sheets
+        ts = self.tileSize
+        ids = np.arange(self.nextId, self.nextId + len(placements), dtype=np.int32)
+        self.nextId += len(placements)
+        self.changes += len(placements)
+
+        x, y = placements["x"].astype(np.int64), placements["y"].astype(np.int64)
+        nCols = -(-placements["width"].astype(np.int64) // ts)
+        nRows = -(-placements["height"].astype(np.int64) // ts)
+
+        # single cell placements are written in one go, the rest by slice
+        single = (nCols == 1) & (nRows == 1) & (x < self.nCol) & (y < self.nRow)
+        self.grid[x[single], y[single]] = ids[single]
+        for i in np.flatnonzero(~single):
+            self.grid[x[i] : x[i] + nCols[i], y[i] : y[i] + nRows[i]] = ids[i]
+
+        for id, x, y, w, h, asset, rotation, flags in zip(
+            ids.tolist(),
+            x.tolist(),
+            y.tolist(),
+            placements["width"].tolist(),
+            placements["height"].tolist(),
+            placements["asset"].tolist(),
+            placements["rotation"].tolist(),
+            placements["flags"].tolist(),
+        ):
+            parent = self.placements[id] = cellEntry(
+                (x, y),
+                assets[asset],
+                width=w,
+                height=h,
+                rotation=rotation,
+                flipH=bool(flags & flagFlipH),
+                flipV=bool(flags & flagFlipV),
+                id=id,
+                tileSize=ts,
+            )
+            self.byAsset.setdefault(parent.imagePath, {})[id] = parent
+
+        counts = np.bincount(placements["asset"], minlength=len(assets))
+        for asset, count in zip(assets, counts.tolist()):
+            if count:
+                self.use(asset, count)
+
+    def anchors(self):
+        return list(self.placements.values())
+
+    def placementsOf(self, imagePath):
+        # reverse index, all placements of the asset with this basename
+        return list(self.byAsset.get(os.path.basename(imagePath), {}).values())
+
+    def use(self, imagePath, delta):
+        # reference counts placements per asset basename. usedImagePaths and
+        # the usage listeners only change when an asset becomes (un)used.
+        count = self.usage.get(imagePath, 0) + delta
+        if count > 0:
+            self.usage[imagePath] = count
+        else:
+            self.usage.pop(imagePath, None)
+
+        if count > 0 and count == delta:
+            self.usedImagePaths.add(imagePath)
+            for listener in self.usageListeners:
+                listener(imagePath, True)
+        elif count <= 0:
+            self.usedImagePaths.discard(imagePath)
+            for listener in self.usageListeners:
+                listener(imagePath, False)
+
+    def usageCount(self, imagePath):
+        return self.usage.get(os.path.basename(imagePath), 0)
+
+    def usageCounts(self, imagePaths=None):
+        # number of placements per asset basename. With imagePaths, every one
+        # of them is reported, including the ones that are never used.
+        if imagePaths is None:
+            return dict(self.usage)
+        return {os.path.basename(p): self.usageCount(p) for p in imagePaths}
+
+    def unsaved(self):
+        return self.changes != self.savedChanges
+
+    def save(self, path):
+        self.journalToken = newJournalToken()
+        saveSheet(self, path)
+
+    def drawCell(self, pos, image, baseToPath=None):
+        # returns the pixel box (x1, y1, x2, y2) that was drawn, if any
+        if not self.hasCell(pos):
+            return None
+
+        cell = self.getCell(pos)
+        if cell.parent:
+            return None
+
+        if baseToPath is None:
+            baseToPath = self.content.baseToPath
+
+        img = cell.imagePath
+        path = baseToPath.get(img, None)
+        row, col = pos
+        if path is None:
+            problem = f"No image found with basename {img}"
+        else:
+            try:
+                img = openVariant(path, cell.rotation, cell.flipH, cell.flipV)
+            except OSError as e:
+                # e.g. a truncated file whose header could still be read
+                problem = f"Could not read {path}: {e}"
+            else:
+                x, y = row * self.tileSize, col * self.tileSize
+                image.paste(img, (x, y))
+                return x, y, x + img.width, y + img.height
+
+        x1, y1, x2, y2 = (
+            row * self.tileSize,
+            col * self.tileSize,
+            (row + 1) * self.tileSize,
+            (col + 1) * self.tileSize,
+        )
+        # a paste works on mapped canvases as well as on images
+        image.paste((255, 0, 0, 255), (x1, y1, x2 + 1, y2 + 1))
+        print(f"{problem}. Replaced visuals with red tile.")
+        return x1, y1, x2 + 1, y2 + 1
+
+
+class unusedAssets:
+    # Ordered index of the assets of a directory scan (items, in scan order)
+    # that have no placement in entries, kept in sync through
+    # cellEntries.usageListeners.
+
+    def __init__(self, items, entries):
+        self.items = items
+        self.positions = {path: i for i, path in enumerate(items)}
+        self.byName = {}
+        for i, path in enumerate(items):
+            self.byName.setdefault(os.path.basename(path), []).append(i)
+
+        self.unused = [
+            i
+            for i, path in enumerate(items)
+            if os.path.basename(path) not in entries.usedImagePaths
+        ]
+        self.entries = entries
+        entries.usageListeners.append(self.usageChanged)
+
+    def detach(self):
+        self.entries.usageListeners.remove(self.usageChanged)
+
+    def usageChanged(self, imagePath, used):
+        for i in self.byName.get(imagePath, ()):
+            j = bisect_left(self.unused, i)
+            present = j < len(self.unused) and self.unused[j] == i
+            if used and present:
+                del self.unused[j]
+            elif not used and not present:
+                self.unused.insert(j, i)
+
+    def position(self, path):
+        return self.positions.get(path, -1)
+
+    def next(self, path=None):
+        # first unused asset after path in scan order, wrapping around
+        if not self.unused:
+            return None
+        j = bisect_right(self.unused, self.position(path))
+        return self.items[self.unused[j % len(self.unused)]]
+
+
+def sheetPaths(name):
+    # <name>, <name>.p and <name>.png all refer to the same sheet
+    root, ext = os.path.splitext(name)
+    if ext in (".p", ".png"):
+        name = root
+    return f"{name}.p", f"{name}.png"
+
+
+def variantsPath(sheetPath):
+    return f"{sheetPath}.variants"
+
+
+def sheetVariants(sheetPath):
+    # names of the variants tsm filter wrote of the sheet, see filterFile
+    try:
+        with open(variantsPath(sheetPath), encoding="utf-8") as fil:
+            return set(fil.read().split())
+    except OSError:
+        return set()
+
+
+def addSheetVariants(sheetPath, names):
+    names = set(names) - sheetVariants(sheetPath)
+    if names:
+        with open(variantsPath(sheetPath), "a", encoding="utf-8") as fil:
+            fil.writelines(f"{name}\n" for name in sorted(names))
+
+
+def isSheetImage(path, siblings=None):
+    # a png with a .p file next to it is a tilesheet, not an asset. Images
+    # derived from a sheet are recognised through the .p file of the
+    # original: <sheet>_darkened.png, and <sheet>_<name>.png for the variant
+    # names tsm filter recorded next to it (see sheetVariants). Other
+    # <sheet>_*.png files are assets. siblings is the set of names in the
+    # same directory, when already known.
+    if siblings is None:
+        exists = os.path.exists
+    else:
+        exists = lambda p: os.path.basename(p) in siblings
+
+    root = path[: -len(".png")]
+    if exists(f"{root}.p"):
+        return True
+    directory, name = os.path.split(root)
+    for i, c in enumerate(name):
+        if c != "_" or not i:
+            continue
+        sheetPath = os.path.join(directory, f"{name[:i]}.p")
+        suffix = name[i + 1 :]
+        if suffix == "darkened" and exists(sheetPath):
+            return True
+        if exists(variantsPath(sheetPath)) and suffix in sheetVariants(sheetPath):
+            return True
+    return False
+
+
+def walkAssets(path, recursive=True):
+    # yields (directory, path, isDirectory) for every asset and subdirectory,
+    # a directory being followed by its contents unless recursive is False.
+    # Every directory is listed once, sheet detection uses that listing
+    # instead of probing for files.
+    try:
+        with os.scandir(path) as it:
+            entries = [(entry.name, entry.is_dir()) for entry in it]
+    except OSError:
+        return
+
+    names = {name for name, _ in entries}
+    for name, isDir in entries:
+        if name.startswith("."):
+            continue
+        fil = os.path.join(path, name)
+        if isDir:
+            yield path, fil, True
+            if recursive:
+                yield from walkAssets(fil)
+        elif name.endswith(".png") and not isSheetImage(fil, names):
+            yield path, fil, False
+
+
+def addAsset(items, baseToPath, fil, report=True):
+    items.append(fil)
+
+    basename = os.path.basename(fil)
+    if basename in baseToPath:
+        if report:
+            print(f"Duplicate tile name found!:\n- {fil} \n- {baseToPath[basename]}")
+    else:
+        baseToPath[basename] = fil
+
+
+def scanDirectory(path):
+    # recursive scan for assets, returns the asset paths in scan order and the
+    # basename -> path map used to resolve cellEntry.imagePath
+    items, baseToPath = [], {}
+    for _, fil, isDir in walkAssets(path):
+        if not isDir:
+            addAsset(items, baseToPath, fil)
+
+    return items, baseToPath
+
+
+# On-disk sheet format. Only the anchor of every placement is stored, the
+# covered cells are rebuilt on load:
+#
+#   magic          8 bytes  b"TSMSHEET"
+#   version        uint16
+#   header length  uint32
+#   header         utf-8 JSON: tileSize, nRow, nCol, assets (basenames),
+#                  placements (count), aliases (optional, as in
+#                  cellEntries.aliases), journal (optional, see
+#                  cellEntries.journalToken)
+#   placements     placements * placementDtype
+#
+# All integers are little endian.
+sheetMagic = b"TSMSHEET"
+sheetVersion = 1
+sheetPrefix = struct.Struct("<8sHI")
+
+placementDtype = np.dtype(
+    [
+        ("x", "<u4"),
+        ("y", "<u4"),
+        ("width", "<u4"),
+        ("height", "<u4"),
+        ("asset", "<u4"),
+        ("rotation", "<u2"),
+        ("flags", "u1"),
+    ]
+)
+flagFlipH = 1
+flagFlipV = 2
+
+
+def saveSheet(entries, path):
+    anchors = entries.anchors()
+    assets = sorted({cell.imagePath for cell in anchors})
+    assetIndex = {asset: i for i, asset in enumerate(assets)}
+
+    placements = np.zeros(len(anchors), dtype=placementDtype)
+    for i, cell in enumerate(anchors):
+        flags = (flagFlipH if cell.flipH else 0) | (flagFlipV if cell.flipV else 0)
+        placements[i] = (
+            cell.position[0],
+            cell.position[1],
+            cell.width,
+            cell.height,
+            assetIndex[cell.imagePath],
+            cell.rotation or 0,
+            flags,
+        )
+
+    header = json.dumps(
+        {
+            "tileSize": entries.tileSize,
+            "nRow": entries.nRow,
+            "nCol": entries.nCol,
+            "assets": assets,
+            "placements": len(anchors),
+            "aliases": entries.aliases,
+            "journal": entries.journalToken,
+        }
+    ).encode("utf-8")
+
+    # written next to the target and moved over it, so an interrupted save
+    # never leaves a truncated sheet behind
+    tmpPath = f"{path}.tmp"
+    with open(tmpPath, "wb") as fil:
+        fil.write(sheetPrefix.pack(sheetMagic, sheetVersion, len(header)))
+        fil.write(header)
+        fil.write(placements.tobytes())
+    os.replace(tmpPath, path)
+    entries.savedChanges = entries.changes
+
+
+def newJournalToken():
+    return os.urandom(16).hex()
+
+
+class sheetSnapshot:
+    # The placements of a cellEntries at one point in time, to be written by
+    # saveSheet on another thread while the cellEntries keeps changing.
+    # Placements are never modified once created, so copying the list of
+    # them is enough.
+
+    def __init__(self, entries, journalToken):
+        self.tileSize = entries.tileSize
+        self.nRow = entries.nRow
+        self.nCol = entries.nCol
+        self.aliases = dict(entries.aliases)
+        self.placements = list(entries.placements.values())
+        self.journalToken = journalToken
+        self.changes = entries.changes
+
+    def anchors(self):
+        return self.placements
+
+
+def parseSheet(data):
+    magic, version, headerLength = sheetPrefix.unpack_from(data)
+    if version > sheetVersion:
+        raise ValueError(
+            f"Sheet format version {version} is newer than the supported version {sheetVersion}"
+        )
+
+    start = sheetPrefix.size
+    header = json.loads(data[start : start + headerLength].decode("utf-8"))
+    placements = np.frombuffer(
+        data,
+        dtype=placementDtype,
+        count=header["placements"],
+        offset=start + headerLength,
+    )
+
+    entries = cellEntries(header["tileSize"], header["nRow"], header["nCol"])
+    entries.placeAll(placements, header["assets"])
+    entries.aliases = {
+        name: tuple(alias) for name, alias in header.get("aliases", {}).items()
+    }
+    entries.journalToken = header.get("journal", None)
+    entries.savedChanges = entries.changes
+    return entries
+
+
+class legacyCellEntries:
+    pass
+
+
+class legacyCellEntry:
+    pass
+
+
+class sheetUnpickler(pickle.Unpickler):
+    # Sheets used to be pickled cellEntries objects, referencing
+    # run.cellEntries (or __main__.cellEntries when run as a script). They
+    # are unpickled into plain stand-ins and migrated in migrateSheet.
+
+    legacyClasses = {"cellEntries": legacyCellEntries, "cellEntry": legacyCellEntry}
+
+    def find_class(self, module, name):
+        if module in ("run", "__main__", __name__) and name in self.legacyClasses:
+            return self.legacyClasses[name]
+        return super().find_class(module, name)
+
+
+def migrateSheet(legacy):
+    entries = cellEntries(legacy.tileSize, legacy.nRow, legacy.nCol)
+    for pos, cell in legacy.entries.items():
+        if cell.parent is not None:
+            continue
+        entries.place(
+            tuple(pos),
+            os.path.basename(cell.imagePath),
+            cell.width,
+            cell.height,
+            cell.rotation,
+            cell.flipH,
+            cell.flipV,
+        )
+    return entries
+
+
+def loadSheet(path):
+    # reads both the current format and legacy pickles, which are migrated on
+    # the fly and written back in the current format on the next save
+    with open(path, "rb") as fil:
+        data = fil.read()
+
+    if data.startswith(sheetMagic):
+        return parseSheet(data)
+    return migrateSheet(sheetUnpickler(io.BytesIO(data)).load())
+
+
+# Number of threads decoding/transforming assets in renderSheet, defaults to
+# the ThreadPoolExecutor default when None.
+renderWorkers = None
+
+# Unique (asset, orientation) pairs prepared per batch in renderSheet. Keeps
+# the prepared batch within the variant cache budget.
+renderBatchSize = 256
+
+
+def prepareVariants(job):
+    path, orientations = job
+    for orientation in orientations:
+        try:
+            openVariant(path, *orientation)
+        except OSError:
+            # reported when the placement is drawn
+            return
+
+
+def renderSheet(entries, image, baseToPath, workers=None):
+    # draws every placement of entries into image. Decoding and transforming
+    # the assets is done by a thread pool which fills the shared variant
+    # cache, the pastes themselves then happen in order on this thread.
+    anchors = [cell.position for cell in entries.anchors()]
+
+    with ThreadPoolExecutor(workers or renderWorkers) as pool:
+        for start in range(0, len(anchors), renderBatchSize):
+            batch = anchors[start : start + renderBatchSize]
+
+            jobs = {}
+            for pos in batch:
+                cell = entries.getCell(pos)
+                path = baseToPath.get(cell.imagePath, None)
+                if path is not None:
+                    orientation = (cell.rotation, cell.flipH, cell.flipV)
+                    jobs.setdefault(path, set()).add(orientation)
+
+            for _ in pool.map(prepareVariants, jobs.items()):
+                pass
+
+            for pos in batch:
+                entries.drawCell(pos, image, baseToPath)
+
+    return image
+
+
+def newSheetImage(entries, mapped=None):
+    # sheets of more than mappedPixels pixels (or with mapped, any sheet) are
+    # rendered into a memory-mapped canvas instead of an in-memory image
+    size = (entries.tileSize * entries.nCol, entries.tileSize * entries.nRow)
+    if mapped is None:
+        mapped = size[0] * size[1] > mappedPixels
+    if mapped:
+        return mappedCanvas(size)
+    return Image.new("RGBA", size, (0, 0, 0, 0))
+
+
+# Compression profile of saved sheet images, see pngstream.compressionLevels.
+# Can be overridden with TSM_COMPRESSION or --compression=<profile>.
+defaultCompression = os.environ.get("TSM_COMPRESSION", "default")
+
+# In-memory sheet images of more than parallelPixels pixels are encoded in
+# parallel strips by pngstream, smaller ones by PIL.
+parallelPixels = 4 * 1024 * 1024
+
+
+def saveSheetImage(image, path, compression=None, workers=None):
+    level = compressionLevels[compression or defaultCompression]
+    if isinstance(image, mappedCanvas):
+        image.save(path, level, workers)
+    elif image.width * image.height > parallelPixels:
+        writePng(path, image.width, image.height, imageBands(image), level, workers)
+    else:
+        image.save(path, compress_level=level)
+
+
+def sheetImageStale(entries, sheetPath, imagePath, baseToPath):
+    # whether the image at imagePath may not show entries as drawn from the
+    # assets in baseToPath: it is missing, older than the sheet or than one
+    # of its assets, or one of its assets is missing
+    try:
+        imageTime = os.stat(imagePath).st_mtime_ns
+    except OSError:
+        return True
+
+    paths = [sheetPath]
+    for basename in entries.usedImagePaths:
+        if basename not in baseToPath:
+            return True
+        paths.append(baseToPath[basename])
+
+    for path in paths:
+        try:
+            if os.stat(path).st_mtime_ns > imageTime:
+                return True
+        except OSError:
+            return True
+    return False
@@ -1,80 +0,0 @@
-# -*- coding: utf-8 -*-
-
-# Form implementation generated from reading ui file 'table.ui'
-#
-# Created by: PyQt5 UI code generator 5.15.4
-#
-# WARNING: Any manual changes made to this file will be lost when pyuic5 is
-# run again.  Do not edit this file unless you know what you are doing.
-
-
-from PyQt5 import QtCore, QtGui, QtWidgets
-
-
-class Ui_Form(object):
-    def setupUi(self, Form):
-        Form.setObjectName("Form")
-        Form.resize(364, 378)
-        self.verticalLayout = QtWidgets.QVBoxLayout(Form)
-        self.verticalLayout.setContentsMargins(1, 1, 0, 0)
-        self.verticalLayout.setSpacing(0)
-        self.verticalLayout.setObjectName("verticalLayout")
-        self.tableWidget = QtWidgets.QTableWidget(Form)
-        self.tableWidget.setGridStyle(QtCore.Qt.SolidLine)
-        self.tableWidget.setObjectName("tableWidget")
-        self.tableWidget.setColumnCount(5)
-        self.tableWidget.setRowCount(5)
-        item = QtWidgets.QTableWidgetItem()
-        self.tableWidget.setVerticalHeaderItem(0, item)
-        item = QtWidgets.QTableWidgetItem()
-        self.tableWidget.setVerticalHeaderItem(1, item)
-        item = QtWidgets.QTableWidgetItem()
-        self.tableWidget.setVerticalHeaderItem(2, item)
-        item = QtWidgets.QTableWidgetItem()
-        self.tableWidget.setVerticalHeaderItem(3, item)
-        item = QtWidgets.QTableWidgetItem()
-        self.tableWidget.setVerticalHeaderItem(4, item)
-        item = QtWidgets.QTableWidgetItem()
-        self.tableWidget.setHorizontalHeaderItem(0, item)
-        item = QtWidgets.QTableWidgetItem()
-        self.tableWidget.setHorizontalHeaderItem(1, item)
-        item = QtWidgets.QTableWidgetItem()
-        self.tableWidget.setHorizontalHeaderItem(2, item)
-        item = QtWidgets.QTableWidgetItem()
-        self.tableWidget.setHorizontalHeaderItem(3, item)
-        item = QtWidgets.QTableWidgetItem()
-        self.tableWidget.setHorizontalHeaderItem(4, item)
-        self.tableWidget.horizontalHeader().setVisible(False)
-        self.tableWidget.horizontalHeader().setDefaultSectionSize(32)
-        self.tableWidget.horizontalHeader().setMinimumSectionSize(32)
-        self.tableWidget.verticalHeader().setVisible(False)
-        self.tableWidget.verticalHeader().setDefaultSectionSize(32)
-        self.tableWidget.verticalHeader().setMinimumSectionSize(32)
-        self.verticalLayout.addWidget(self.tableWidget)
-
-        self.retranslateUi(Form)
-        QtCore.QMetaObject.connectSlotsByName(Form)
-
-    def retranslateUi(self, Form):
-        _translate = QtCore.QCoreApplication.translate
-        Form.setWindowTitle(_translate("Form", "Form"))
-        item = self.tableWidget.verticalHeaderItem(0)
-        item.setText(_translate("Form", "0"))
-        item = self.tableWidget.verticalHeaderItem(1)
-        item.setText(_translate("Form", "2344"))
-        item = self.tableWidget.verticalHeaderItem(2)
-        item.setText(_translate("Form", "1"))
-        item = self.tableWidget.verticalHeaderItem(3)
-        item.setText(_translate("Form", "2"))
-        item = self.tableWidget.verticalHeaderItem(4)
-        item.setText(_translate("Form", "3"))
-        item = self.tableWidget.horizontalHeaderItem(0)
-        item.setText(_translate("Form", "0"))
-        item = self.tableWidget.horizontalHeaderItem(1)
-        item.setText(_translate("Form", "234"))
-        item = self.tableWidget.horizontalHeaderItem(2)
-        item.setText(_translate("Form", "1"))
-        item = self.tableWidget.horizontalHeaderItem(3)
-        item.setText(_translate("Form", "2"))
-        item = self.tableWidget.horizontalHeaderItem(4)
-        item.setText(_translate("Form", "3"))
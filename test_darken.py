@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from PIL import Image
+from filters import darken
+
+# darken has to stay byte-identical to the per-pixel loop tsm darken
+# started out with, kept here as the reference.
+
+
+def darkenPerPixel(image, r, g, b, a):
+    rgb = np.array([r, g, b])
+    pixels = np.array(image) / 255
+    for i in range(pixels.shape[0]):
+        for j in range(pixels.shape[1]):
+            p = pixels[i, j]
+            aij = p[3]
+            if aij == 0:
+                continue
+            p[:3] = rgb * a + p[:3] * (1 - a)
+            p[3] = a + aij - a * aij
+    return Image.fromarray(np.uint8(pixels * 255))
+
+
+def randomImage(mode, seed, size=(37, 29)):
+    # RGBA images get a share of 0-alpha pixels, and every alpha value
+    rng = np.random.default_rng(seed)
+    w, h = size
+    pixels = rng.integers(0, 256, (h, w, 4), dtype=np.uint8)
+    pixels[..., 3][rng.random((h, w)) < 0.25] = 0
+    pixels[0, : min(w, 256), 3] = np.arange(min(w, 256))
+    image = Image.fromarray(pixels, "RGBA")
+    if mode == "RGB":
+        # as commandDarken does for RGB sheets
+        image = image.convert("RGB")
+        image.putalpha(255)
+    return image
+
+
+tints = [
+    (0.2, 0.1, 0, 0.5),
+    (0, 0, 0, 0),
+    (1, 1, 1, 1),
+    (0.3, 0.6, 0.9, 1),
+    (0.5, 0.25, 0.75, 0),
+    (0, 0, 0.2, 0.35),
+]
+
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA"])
+@pytest.mark.parametrize("seed", [0, 1])
+@pytest.mark.parametrize("rgba", tints)
+def test_darken_matches_per_pixel_loop(mode, seed, rgba):
+    image = randomImage(mode, seed)
+    expected = np.array(darkenPerPixel(image, *rgba))
+    assert np.array(darken(image, *rgba)).tobytes() == expected.tobytes()
+
+
+def test_darken_chunks():
+    # chunk boundaries that do not divide the height
+    image = randomImage("RGBA", 2, (16, 41))
+    expected = np.array(darkenPerPixel(image, 0.2, 0.1, 0, 0.5))
+    actual = darken(image, 0.2, 0.1, 0, 0.5, chunkRows=7)
+    assert np.array(actual).tobytes() == expected.tobytes()
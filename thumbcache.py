@@ -0,0 +1,132 @@
+import os, sqlite3, threading
+
+# file name of the cache, inside the asset directory
+cacheName = ".tsm_cache.sqlite"
+
+
+class cacheFile:
+    # The SQLite file inside an asset directory. Its tables (thumbnails, see
+    # assetindex for the others) share one connection, so batched writes to
+    # one of them never lock out the others. Safe to use from several
+    # threads, callers hold self.lock around every use of self.db.
+
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.RLock()
+        self.pending = 0
+
+        try:
+            self.db = sqlite3.connect(
+                os.path.join(root, cacheName), check_same_thread=False
+            )
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+        except sqlite3.Error as e:
+            print(f"Cache in {root} disabled: {e}")
+            self.db = None
+
+    def key(self, path):
+        # paths found by scanning root start with it, relpath is the (slow)
+        # fallback for everything else
+        prefix = os.path.join(self.root, "")
+        if path.startswith(prefix):
+            return path[len(prefix) :]
+        return os.path.relpath(path, self.root)
+
+    def commit(self):
+        self.db.commit()
+        self.pending = 0
+
+    def close(self):
+        with self.lock:
+            if self.db is None:
+                return
+            self.commit()
+            self.db.close()
+            self.db = None
+
+
+class thumbnailCache:
+    # Pre-scaled icon pixels (RGBA, 8 bit per channel) of the assets below
+    # the root of a cacheFile. Entries are keyed by the path relative to root
+    # and are only valid for the mtime/size and icon size they were made
+    # from.
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS thumbnails (
+            path TEXT PRIMARY KEY,
+            mtime INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            iconSize INTEGER NOT NULL,
+            width INTEGER NOT NULL,
+            height INTEGER NOT NULL,
+            pixels BLOB NOT NULL
+        )
+    """
+
+    # writes are committed in batches
+    commitEvery = 256
+
+    def __init__(self, cache, iconSize):
+        self.cache = cache
+        self.iconSize = iconSize
+        self.hits = 0
+        self.misses = 0
+
+        with cache.lock:
+            if cache.db is not None:
+                cache.db.execute(self.schema)
+
+    def get(self, path, stat):
+        # returns (width, height, pixels) or None if missing or stale
+        cache = self.cache
+        with cache.lock:
+            if cache.db is None:
+                return None
+            row = cache.db.execute(
+                "SELECT mtime, size, iconSize, width, height, pixels FROM thumbnails WHERE path = ?",
+                (cache.key(path),),
+            ).fetchone()
+
+        if row is None or row[:3] != (stat.st_mtime_ns, stat.st_size, self.iconSize):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return row[3], row[4], row[5]
+
+    def put(self, path, stat, width, height, pixels):
+        cache = self.cache
+        with cache.lock:
+            if cache.db is None:
+                return
+            cache.db.execute(
+                "INSERT OR REPLACE INTO thumbnails VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    cache.key(path),
+                    stat.st_mtime_ns,
+                    stat.st_size,
+                    self.iconSize,
+                    width,
+                    height,
+                    pixels,
+                ),
+            )
+            cache.pending += 1
+            if cache.pending >= self.commitEvery:
+                cache.commit()
+
+    def prune(self, paths):
+        # drops the entries of every asset that is not in paths anymore
+        cache = self.cache
+        keep = {cache.key(path) for path in paths}
+        with cache.lock:
+            if cache.db is None:
+                return
+            stale = [
+                (key,)
+                for (key,) in cache.db.execute("SELECT path FROM thumbnails")
+                if key not in keep
+            ]
+            cache.db.executemany("DELETE FROM thumbnails WHERE path = ?", stale)
+            cache.commit()